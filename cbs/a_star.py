@@ -5,18 +5,25 @@ AStar search
 author: Ashwin Bose (@atb033)
 
 """
+from collections import deque
+from heapq import heappush, heappop
 
 class AStar():
     def __init__(self, env):
         self.agent_dict = env.agent_dict
         self.admissible_heuristic = env.admissible_heuristic
         self.is_at_goal = env.is_at_goal
+        self.earliest_goal_time = env.earliest_goal_time
         self.get_neighbors = env.get_neighbors
+        self.avoidance_conflicts = env.avoidance_conflicts
+        self.state_key = env.state_key
 
     def reconstruct_path(self, came_from, current):
         total_path = [current]
-        while current in came_from.keys():
-            current = came_from[current]
+        current_key = self.state_key(current)
+        while current_key in came_from:
+            current = came_from[current_key]
+            current_key = self.state_key(current)
             total_path.append(current)
         return total_path[::-1]
 
@@ -25,46 +32,335 @@ class AStar():
         low level search 
         """
         initial_state = self.agent_dict[agent_name]["start"]
+        initial_key = self.state_key(initial_state)
         step_cost = 1
+
+        # Stopping earlier would leave the agent parked on a constrained goal
+        goal_time = self.earliest_goal_time(agent_name)
         
         closed_set = set()
-        open_set = {initial_state}
-
         came_from = {}
 
         g_score = {} 
-        g_score[initial_state] = 0
+        g_score[initial_key] = 0
 
-        f_score = {} 
+        # Conflicts with the other agents, used to break ties between equal f-scores
+        conflicts = {}
+        conflicts[initial_key] = 0
 
-        f_score[initial_state] = self.admissible_heuristic(initial_state, agent_name)
+        # Entries are (f, conflicts, -g, counter, state). Improved states are
+        # pushed again and their stale entries skipped once the state is closed.
+        initial_f_score = self.admissible_heuristic(initial_state, agent_name)
+        if initial_f_score == float("inf"):
+            # The goal cannot be reached from the start
+            return False
+        counter = 0
+        open_heap = [(initial_f_score, 0, 0, counter, initial_state)]
 
-        while open_set:
-            temp_dict = {open_item:f_score.setdefault(open_item, float("inf")) for open_item in open_set}
-            current = min(temp_dict, key=temp_dict.get)
+        while open_heap:
+            current = heappop(open_heap)[-1]
+            current_key = self.state_key(current)
+            if current_key in closed_set:
+                continue
 
-            if self.is_at_goal(current, agent_name):
+            if self.is_at_goal(current, agent_name) and current.time >= goal_time:
                 return self.reconstruct_path(came_from, current)
 
-            open_set -= {current}
-            closed_set |= {current}
+            closed_set.add(current_key)
 
             neighbor_list = self.get_neighbors(current)
 
             for neighbor in neighbor_list:
-                if neighbor in closed_set:
+                neighbor_key = self.state_key(neighbor)
+                if neighbor_key in closed_set:
                     continue
                 
-                tentative_g_score = g_score.setdefault(current, float("inf")) + step_cost
+                tentative_g_score = g_score[current_key] + step_cost
+                tentative_conflicts = conflicts[current_key] + self.avoidance_conflicts(current, neighbor)
 
-                if neighbor not in open_set:
-                    open_set |= {neighbor}
-                elif tentative_g_score >= g_score.setdefault(neighbor, float("inf")):
+                if neighbor_key in g_score and \
+                        (tentative_g_score, tentative_conflicts) >= (g_score[neighbor_key], conflicts[neighbor_key]):
                     continue
 
-                came_from[neighbor] = current
+                came_from[neighbor_key] = current
 
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = g_score[neighbor] + self.admissible_heuristic(neighbor, agent_name)
+                g_score[neighbor_key] = tentative_g_score
+                conflicts[neighbor_key] = tentative_conflicts
+                f_score = tentative_g_score + self.admissible_heuristic(neighbor, agent_name)
+                counter += 1
+                heappush(open_heap, (f_score, tentative_conflicts, -tentative_g_score, counter, neighbor))
         return False
 
+    def focal_search(self, agent_name, suboptimality):
+        """
+        low level focal search of ECBS, returns a path whose cost is within
+        suboptimality of the optimal one together with a lower bound on the
+        optimal cost, or False
+        """
+        initial_state = self.agent_dict[agent_name]["start"]
+        initial_key = self.state_key(initial_state)
+        goal_time = self.earliest_goal_time(agent_name)
+
+        initial_f_score = self.admissible_heuristic(initial_state, agent_name)
+        if initial_f_score == float("inf"):
+            return False
+
+        closed_set = set()
+        came_from = {}
+        g_score = {initial_key: 0}
+        conflicts = {initial_key: 0}
+        open_f_score = {initial_key: initial_f_score}
+
+        # Every state is in the open heap, ordered by f-score, which gives the
+        # lower bound. Focal holds the open states with f <= w * f_min ordered
+        # by conflicts, the others wait in the pending heap until f_min has
+        # grown enough. g is the time, which is part of the state up to the
+        # last constraint, so entries become stale once their state is
+        # reached earlier or with fewer conflicts.
+        counter = 0
+        open_heap = [(initial_f_score, counter, initial_key)]
+        focal_heap = [(0, initial_f_score, 0, counter, initial_state)]
+        pending_heap = []
+
+        while focal_heap or pending_heap:
+            while open_heap and open_heap[0][-1] in closed_set:
+                heappop(open_heap)
+            if not open_heap:
+                return False
+            f_min = open_heap[0][0]
+
+            while pending_heap and pending_heap[0][0] <= suboptimality * f_min:
+                f_score, entry_counter, entry_conflicts, current = heappop(pending_heap)
+                heappush(focal_heap, (entry_conflicts, f_score, -current.time, entry_counter, current))
+
+            current_conflicts, _, _, _, current = heappop(focal_heap)
+            current_key = self.state_key(current)
+            if current_key in closed_set or (current.time, current_conflicts) != \
+                    (g_score[current_key], conflicts[current_key]):
+                continue
+
+            if self.is_at_goal(current, agent_name) and current.time >= goal_time:
+                return self.reconstruct_path(came_from, current), int(f_min) + 1
+
+            closed_set.add(current_key)
+
+            for neighbor in self.get_neighbors(current):
+                neighbor_key = self.state_key(neighbor)
+                if neighbor_key in closed_set:
+                    continue
+
+                tentative_conflicts = current_conflicts + self.avoidance_conflicts(current, neighbor)
+                known = neighbor_key in g_score
+                if known and (neighbor.time, tentative_conflicts) >= (g_score[neighbor_key], conflicts[neighbor_key]):
+                    continue
+
+                came_from[neighbor_key] = current
+                g_score[neighbor_key] = neighbor.time
+                conflicts[neighbor_key] = tentative_conflicts
+                f_score = neighbor.time + self.admissible_heuristic(neighbor, agent_name)
+                counter += 1
+                if not known or f_score < open_f_score[neighbor_key]:
+                    open_f_score[neighbor_key] = f_score
+                    heappush(open_heap, (f_score, counter, neighbor_key))
+                if f_score <= suboptimality * f_min:
+                    heappush(focal_heap, (tentative_conflicts, f_score, -neighbor.time, counter, neighbor))
+                else:
+                    heappush(pending_heap, (f_score, counter, tentative_conflicts, neighbor))
+        return False
+
+class JointAStar():
+    """
+    Coupled low level of MA-CBS: A* over the joint states of a meta-agent.
+    With operator decomposition, a step of the group is made of one move per
+    agent, in order, and the intermediate states are searched as well, so
+    only the moves of one agent are generated at a time and the joint moves
+    that cannot be optimal are never built. Each agent keeps its own
+    constraints, and the agents of the group never conflict with each other.
+    """
+    def __init__(self, env):
+        self.env = env
+
+    def get_neighbors(self, agent_name, state, constraints):
+        self.env.constraints = constraints
+        return self.env.get_neighbors(state)
+
+    def search(self, agent_names, constraint_dict, budget=None):
+        """
+        Paths of the agents with the smallest sum of costs, or False if
+        there are none or the budget runs out. An agent's path ends when it
+        reaches its goal for the last time, and not before the earliest goal
+        time its own constraints allow.
+        """
+        env = self.env
+        num_agents = len(agent_names)
+        starts = []
+        goals = []
+        goal_times = []
+        horizon = 0
+        for agent_name in agent_names:
+            constraints = constraint_dict[agent_name]
+            env.constraints = constraints
+            starts.append(env.agent_dict[agent_name]["start"])
+            goals.append(env.agent_dict[agent_name]["goal"].location)
+            goal_times.append(env.earliest_goal_time(agent_name))
+            horizon = max(horizon, constraints.max_time)
+            # The group is stuck if one of its agents is stuck on its own
+            if not env.a_star.search(agent_name):
+                return False
+        goal_time = max(goal_times)
+        # Time from which A* checks that the group can reach its goals at all,
+        # once past the last constraint by more than any agent needs alone
+        check_time = horizon + 1 + max(env.admissible_heuristic(state, agent_name)
+                                       for agent_name, state in zip(agent_names, starts))
+        reachable = None
+
+        def agent_f_score(i, state, arrival):
+            # Agents at their goal are charged up to their arrival, and none
+            # before its earliest goal time
+            if arrival < 0:
+                arrival = state.time + env.admissible_heuristic(state, agent_names[i])
+            return max(arrival, goal_times[i]) + 1
+
+        # A search node is the time of the step, the states of the agents
+        # and their cells (the first `moved` agents already one step ahead),
+        # the cells at the start of the step, and the arrivals at the goals.
+        # The cells the moved agents left decide which moves swap with them.
+        def key(time, states, cells, moved, step_cells, arrivals):
+            return (time, moved, cells, step_cells[:moved], arrivals)
+
+        initial_states = tuple(starts)
+        initial_cells = tuple((state.location.x, state.location.y) for state in starts)
+        goal_cells = tuple((goal.x, goal.y) for goal in goals)
+        initial_arrivals = tuple(0 if cell == goal else -1 for cell, goal in zip(initial_cells, goal_cells))
+        initial_node = (0, initial_states, initial_cells, 0, initial_cells, initial_arrivals)
+
+        closed_set = set()
+        came_from = {}
+        conflicts = {key(*initial_node): 0}
+        # Moves of an agent, with their conflicts with the other agents, only
+        # depend on its own state: they are shared by all the joint states
+        moves = {}
+
+        counter = 0
+        initial_f_score = sum(agent_f_score(i, state, arrival)
+                              for i, (state, arrival) in enumerate(zip(initial_states, initial_arrivals)))
+        open_heap = [(initial_f_score, 0, 0, counter, initial_node)]
+
+        while open_heap:
+            current_f_score, current_conflicts, _, _, node = heappop(open_heap)
+            time, states, cells, moved, step_cells, arrivals = node
+            current_key = key(*node)
+            if current_key in closed_set:
+                continue
+
+            if moved == 0 and time >= goal_time and all(arrival >= 0 for arrival in arrivals):
+                return self.reconstruct_paths(agent_names, came_from, current_key, node, goal_times)
+
+            closed_set.add(current_key)
+            if budget is not None and len(closed_set) % 1024 == 0 and budget.exhausted():
+                return False
+            if moved == 0 and time > check_time and reachable is None:
+                # Groups that cannot reach their goals together would be
+                # searched forever past the last constraint
+                reachable = self.is_reachable(agent_names, constraint_dict, starts, goals, horizon + 1, budget)
+                if not reachable:
+                    return False
+
+            state = states[moved]
+            cell = cells[moved]
+            # Only the moving agent changes the f-score
+            other_f_score = current_f_score - agent_f_score(moved, state, arrivals[moved])
+            move_key = (moved, time, cell)
+            if move_key not in moves:
+                agent_name = agent_names[moved]
+                moves[move_key] = [(next_state, (next_state.location.x, next_state.location.y),
+                                    env.avoidance_conflicts(state, next_state))
+                                   for next_state in self.get_neighbors(agent_name, state, constraint_dict[agent_name])]
+            moved_cells = cells[:moved]
+            for next_state, next_cell, move_conflicts in moves[move_key]:
+                # No vertex or edge conflict with the agents that already moved
+                if next_cell in moved_cells or (cell in moved_cells and
+                                                 step_cells[moved_cells.index(cell)] == next_cell):
+                    continue
+                next_states = states[:moved] + (next_state,) + states[moved + 1:]
+                next_cells = moved_cells + (next_cell,) + cells[moved + 1:]
+                arrival = arrivals[moved]
+                next_arrival = (arrival if arrival >= 0 else time + 1) if next_cell == goal_cells[moved] else -1
+                next_arrivals = arrivals[:moved] + (next_arrival,) + arrivals[moved + 1:]
+                if moved + 1 == num_agents:
+                    next_node = (time + 1, next_states, next_cells, 0, next_cells, next_arrivals)
+                else:
+                    next_node = (time, next_states, next_cells, moved + 1, step_cells, next_arrivals)
+                next_key = key(*next_node)
+                if next_key in closed_set:
+                    continue
+
+                tentative_conflicts = current_conflicts + move_conflicts
+                if next_key in conflicts and tentative_conflicts >= conflicts[next_key]:
+                    continue
+
+                came_from[next_key] = (current_key, node)
+                conflicts[next_key] = tentative_conflicts
+                counter += 1
+                f_score = other_f_score + agent_f_score(moved, next_state, next_arrival)
+                heappush(open_heap, (f_score, tentative_conflicts,
+                                     -(time * num_agents + moved + 1), counter, next_node))
+        return False
+
+    def is_reachable(self, agent_names, constraint_dict, starts, goals, static_time, budget=None):
+        """
+        Whether the agents can all be at their goals together at some time
+        from static_time on. Past the last constraint every time step looks
+        the same, so time is capped at static_time and the search is finite.
+        """
+        def key(states):
+            return (min(states[0].time, static_time),) + tuple((state.location.x, state.location.y)
+                                                               for state in states)
+
+        goal_key = (static_time,) + tuple((goal.x, goal.y) for goal in goals)
+        initial_states = tuple(starts)
+        visited = {key(initial_states)}
+        queue = deque([initial_states])
+        expanded = 0
+        while queue:
+            states = queue.popleft()
+            if key(states) == goal_key:
+                return True
+            expanded += 1
+            if budget is not None and expanded % 1024 == 0 and budget.exhausted():
+                return False
+            moves = [self.get_neighbors(agent_name, state, constraint_dict[agent_name])
+                     for agent_name, state in zip(agent_names, states)]
+            for next_states in self.combine(states, moves):
+                next_key = key(next_states)
+                if next_key not in visited:
+                    visited.add(next_key)
+                    queue.append(next_states)
+        return False
+
+    def combine(self, states, moves, index=0, chosen=()):
+        """
+        Joint moves without vertex or edge conflicts inside the group
+        """
+        if index == len(states):
+            yield chosen
+            return
+        for move in moves[index]:
+            if any(move.location == other.location or
+                   (move.location == states[i].location and other.location == states[index].location)
+                   for i, other in enumerate(chosen)):
+                continue
+            for joint_move in self.combine(states, moves, index + 1, chosen + (move,)):
+                yield joint_move
+
+    def reconstruct_paths(self, agent_names, came_from, current_key, node, goal_times):
+        arrivals = node[5]
+        # Only the nodes at the start of a step hold a joint state
+        joint_path = [node[1]]
+        while current_key in came_from:
+            current_key, node = came_from[current_key]
+            if node[3] == 0:
+                joint_path.append(node[1])
+        joint_path.reverse()
+        return {agent_name: [joint_states[i] for joint_states in joint_path[:max(arrival, agent_goal_time) + 1]]
+                for i, (agent_name, arrival, agent_goal_time) in enumerate(zip(agent_names, arrivals, goal_times))}
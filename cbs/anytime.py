@@ -0,0 +1,149 @@
+"""
+
+Anytime CBS: returns the best conflict-free solution found within a time or
+node budget, with a lower bound on the optimal cost
+
+A bounded-suboptimal ECBS search seeds the incumbent solution, then CBS
+explores the constraint tree by increasing cost, raising the lower bound and
+replacing the incumbent by every cheaper conflict-free node it generates.
+The incumbent is optimal once the lower bound reaches its cost.
+
+See the article: Anytime Focal Search with Applications (Cohen et al.),
+IJCAI 2018
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import yaml
+
+from cbs.cbs import Environment, CBS, SearchBudget
+from cbs.ecbs import ECBS
+
+class AnytimeCBS(CBS):
+    """
+    CBS that keeps the best solution found so far (incumbent) and the best
+    lower bound on the optimal cost, and can be stopped at any time
+    """
+    def __init__(self, environment, suboptimality=1.5, seed_share=0.5, **kwargs):
+        CBS.__init__(self, environment, **kwargs)
+        self.suboptimality = suboptimality
+        # Share of the budget left to the ECBS seed search
+        self.seed_share = seed_share
+        self.incumbent = {}
+        self.incumbent_cost = float('inf')
+        self.lower_bound = 0
+        self.optimal = False
+
+    def search(self, time_limit=None, node_limit=None):
+        """
+        Returns the plan of the incumbent, {} if no solution was found within
+        the budget
+        """
+        budget = self.budget = SearchBudget(time_limit, node_limit)
+        budget.expanded = self.seed(time_limit, node_limit)
+
+        start = self.create_root()
+        if start is None:
+            # Some agent cannot reach its goal at all
+            self.optimal = True
+            return {}
+        self.update_incumbent(start)
+        self.open_set.push(start)
+
+        while self.open_set and not budget.exhausted():
+            P = self.open_set.pop()
+            self.lower_bound = max(self.lower_bound, P.cost + P.h)
+            if self.lower_bound >= self.incumbent_cost:
+                break
+
+            budget.expanded += 1
+            for new_node in self.expand(P):
+                self.update_incumbent(new_node)
+                # Nodes that cannot beat the incumbent are pruned
+                if new_node.conflicts and new_node.cost + new_node.h < self.incumbent_cost:
+                    self.open_set.push(new_node)
+        else:
+            if not self.open_set:
+                # Every node was expanded or pruned
+                self.lower_bound = self.incumbent_cost
+        self.optimal = self.lower_bound >= self.incumbent_cost
+        if self.optimal:
+            self.lower_bound = self.incumbent_cost
+        return self.incumbent
+
+    def seed(self, time_limit, node_limit):
+        """
+        Incumbent and lower bound from a bounded-suboptimal ECBS search on a
+        share of the budget, returns the number of nodes it expanded
+        """
+        ecbs = ECBS(self.env, self.suboptimality, conflict_avoidance=self.conflict_avoidance)
+        plan = ecbs.search(None if time_limit is None else self.seed_share * time_limit,
+                           None if node_limit is None else int(self.seed_share * node_limit))
+        if plan:
+            self.incumbent = plan
+            self.incumbent_cost = sum(len(path) for path in plan.values())
+            self.lower_bound = ecbs.lower_bound
+        return ecbs.budget.expanded
+
+    def update_incumbent(self, node):
+        if not node.conflicts and node.cost < self.incumbent_cost:
+            self.incumbent = self.generate_plan(node.solution)
+            self.incumbent_cost = node.cost
+            print("incumbent of cost {}, lower bound {}".format(node.cost, self.lower_bound))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of the search, in seconds")
+    parser.add_argument("--node-limit", type=int, default=None,
+                        help="budget of expanded high-level nodes")
+    parser.add_argument("-w", "--suboptimality", type=float, default=1.5,
+                        help="suboptimality factor of the ECBS seed search")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    cbs = AnytimeCBS(env, args.suboptimality)
+    solution = cbs.search(args.time_limit, args.node_limit)
+    if not solution:
+        print(" Solution not found" )
+        return
+    if cbs.optimal:
+        print("optimal solution found")
+    else:
+        print("solution cost {}, lower bound {}".format(cbs.incumbent_cost, cbs.lower_bound))
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = cbs.incumbent_cost
+    output["lower_bound"] = cbs.lower_bound
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
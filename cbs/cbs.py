@@ -8,31 +8,40 @@ author: Ashwin Bose (@atb033)
 import sys
 sys.path.insert(0, '../')
 import argparse
+import time
 import yaml
+from collections import deque
 from enum import Enum, auto
-from math import fabs
-from itertools import combinations
-from copy import deepcopy
+from itertools import chain, combinations
+from heapq import heappush, heappop
 
-from cbs.a_star import AStar
+from cbs.a_star import AStar, JointAStar
+from cbs.mdd import MDD, are_dependent
+from cbs.heuristics import HEURISTICS, weighted_vertex_cover
+from distance_table import DistanceTable
+from occupancy_grid import OccupancyGrid
 
 class Location(object):
+    __slots__ = ('x', 'y')
     def __init__(self, x=-1, y=-1):
         self.x = x
         self.y = y
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y
+    def __hash__(self):
+        return hash((self.x, self.y))
     def __str__(self):
         return str((self.x, self.y))
 
 class State(object):
+    __slots__ = ('time', 'location')
     def __init__(self, time, location):
         self.time = time
         self.location = location
     def __eq__(self, other):
         return self.time == other.time and self.location == other.location
     def __hash__(self):
-        return hash(str(self.time)+str(self.location.x) + str(self.location.y))
+        return hash((self.time, self.location.x, self.location.y))
     def is_equal_except_time(self, state):
         return self.location == state.location
     def __str__(self):
@@ -41,6 +50,11 @@ class State(object):
 class Conflict(object):
     VERTEX = 1
     EDGE = 2    
+
+    # Conflict classes, ordered by splitting priority
+    CARDINAL = 0
+    SEMI_CARDINAL = 1
+    NON_CARDINAL = 2
     def __init__(self):
         self.time = -1
         self.type = -1
@@ -63,7 +77,7 @@ class VertexConstraint(object):
     def __eq__(self, other):
         return self.time == other.time and self.location == other.location
     def __hash__(self):
-        return hash(str(self.time)+str(self.location))        
+        return hash((self.time, self.location.x, self.location.y))
     def __str__(self):
         return '(' + str(self.time) + ', '+ str(self.location) + ')' 
 
@@ -76,7 +90,7 @@ class EdgeConstraint(object):
         return self.time == other.time and self.location_1 == other.location_1 \
             and self.location_2 == other.location_2
     def __hash__(self):
-        return hash(str(self.time) + str(self.location_1) + str(self.location_2))
+        return hash((self.time, self.location_1.x, self.location_1.y, self.location_2.x, self.location_2.y))
     def __str__(self):
         return '(' + str(self.time) + ', '+ str(self.location_1) +', '+ str(self.location_2) + ')' 
 
@@ -85,16 +99,270 @@ class Constraints(object):
         self.vertex_constraints = set()
         self.edge_constraints = set()
 
+        # Time-indexed views of the constraint sets, so that validity checks
+        # are lookups of existing Location objects instead of allocations
+        self.vertex_table = {}
+        self.edge_table = {}
+        self.last_vertex_time = {}
+        self.max_time = -1
+
+        # Positive constraints force the agent through a location (vertex)
+        # or a move (edge) at a given time. Both are stored as landmarks,
+        # the locations the agent has to occupy at each constrained time.
+        self.positive_vertex_constraints = set()
+        self.positive_edge_constraints = set()
+        self.landmarks = {}
+        self.implied_constraints = None
+
+        # Target reasoning: a length constraint keeps the agent from finishing
+        # its path at or before a time, a target constraint forbids a
+        # location from a time on, for good
+        self.length_constraints = set()
+        self.min_goal_time = 0
+        self.target_constraints = set()
+        self.target_table = {}
+
+    def add_vertex_constraint(self, constraint):
+        self.vertex_constraints.add(constraint)
+        self.vertex_table.setdefault(constraint.time, set()).add(constraint.location)
+        self.last_vertex_time[constraint.location] = max(constraint.time, \
+            self.last_vertex_time.get(constraint.location, -1))
+        self.max_time = max(self.max_time, constraint.time)
+
+    def add_edge_constraint(self, constraint):
+        self.edge_constraints.add(constraint)
+        self.edge_table.setdefault(constraint.time, {}) \
+            .setdefault(constraint.location_1, set()).add(constraint.location_2)
+        self.max_time = max(self.max_time, constraint.time)
+
+    def add_positive_vertex_constraint(self, constraint):
+        self.positive_vertex_constraints.add(constraint)
+        self.add_landmark(constraint.time, constraint.location)
+
+    def add_positive_edge_constraint(self, constraint):
+        self.positive_edge_constraints.add(constraint)
+        self.add_landmark(constraint.time, constraint.location_1)
+        self.add_landmark(constraint.time + 1, constraint.location_2)
+
+    def add_landmark(self, time, location):
+        self.landmarks.setdefault(time, set()).add(location)
+        self.max_time = max(self.max_time, time)
+        self.implied_constraints = None
+
+    def add_length_constraint(self, time):
+        self.length_constraints.add(time)
+        self.min_goal_time = max(self.min_goal_time, time + 1)
+        self.max_time = max(self.max_time, time)
+
+    def add_target_constraint(self, constraint):
+        self.target_constraints.add(constraint)
+        self.target_table[constraint.location] = min(constraint.time, \
+            self.target_table.get(constraint.location, constraint.time))
+        self.max_time = max(self.max_time, constraint.time)
+
     def add_constraint(self, other):
-        self.vertex_constraints |= other.vertex_constraints
-        self.edge_constraints |= other.edge_constraints
+        for vertex_constraint in other.vertex_constraints:
+            self.add_vertex_constraint(vertex_constraint)
+        for edge_constraint in other.edge_constraints:
+            self.add_edge_constraint(edge_constraint)
+        for vertex_constraint in other.positive_vertex_constraints:
+            self.add_positive_vertex_constraint(vertex_constraint)
+        for edge_constraint in other.positive_edge_constraints:
+            self.add_positive_edge_constraint(edge_constraint)
+        for t in other.length_constraints:
+            self.add_length_constraint(t)
+        for vertex_constraint in other.target_constraints:
+            self.add_target_constraint(vertex_constraint)
+
+    def remove_constraint(self, other):
+        """
+        Take out the vertex, edge and target constraints of other, which were
+        added with add_constraint and are not also added by another source
+        """
+        for constraint in other.vertex_constraints:
+            self.remove_vertex_constraint(constraint)
+        for constraint in other.edge_constraints:
+            self.remove_edge_constraint(constraint)
+        for constraint in other.target_constraints:
+            self.remove_target_constraint(constraint)
+        self.max_time = max(chain(self.vertex_table, self.edge_table, self.target_table.values(),
+                                  self.landmarks, self.length_constraints), default=-1)
+
+    def remove_vertex_constraint(self, constraint):
+        self.vertex_constraints.discard(constraint)
+        locations = self.vertex_table.get(constraint.time)
+        if locations is None or constraint.location not in locations:
+            return
+        locations.remove(constraint.location)
+        if not locations:
+            del self.vertex_table[constraint.time]
+        if self.last_vertex_time[constraint.location] == constraint.time:
+            # The location was constrained last at this time, look for the time before
+            time = constraint.time - 1
+            while time >= 0 and constraint.location not in self.vertex_table.get(time, ()):
+                time -= 1
+            if time >= 0:
+                self.last_vertex_time[constraint.location] = time
+            else:
+                del self.last_vertex_time[constraint.location]
+
+    def remove_edge_constraint(self, constraint):
+        self.edge_constraints.discard(constraint)
+        edges = self.edge_table.get(constraint.time)
+        locations = None if edges is None else edges.get(constraint.location_1)
+        if locations is None or constraint.location_2 not in locations:
+            return
+        locations.remove(constraint.location_2)
+        if not locations:
+            del edges[constraint.location_1]
+            if not edges:
+                del self.edge_table[constraint.time]
+
+    def remove_target_constraint(self, constraint):
+        self.target_constraints.discard(constraint)
+        times = [other.time for other in self.target_constraints if other.location == constraint.location]
+        if times:
+            self.target_table[constraint.location] = min(times)
+        else:
+            self.target_table.pop(constraint.location, None)
+
+    def add_range_constraint(self, location, time_min, time_max):
+        """
+        Forbid a location over a range of timesteps
+        """
+        for t in range(time_min, time_max + 1):
+            self.add_vertex_constraint(VertexConstraint(t, location))
+
+    def add_barrier_constraint(self, locations, start_time):
+        """
+        Forbid a line of locations, each one timestep later than the previous
+        """
+        for i, location in enumerate(locations):
+            self.add_vertex_constraint(VertexConstraint(start_time + i, location))
+
+    def has_positive_constraints(self):
+        return bool(self.landmarks)
+
+    def get_implied_constraints(self):
+        """
+        Negative constraints that the positive constraints of this agent
+        impose on every other agent
+        """
+        if self.implied_constraints is None:
+            self.implied_constraints = Constraints()
+            for constraint in self.positive_vertex_constraints:
+                self.implied_constraints.add_vertex_constraint(constraint)
+            for constraint in self.positive_edge_constraints:
+                self.implied_constraints.add_vertex_constraint(VertexConstraint(constraint.time, constraint.location_1))
+                self.implied_constraints.add_vertex_constraint(VertexConstraint(constraint.time + 1, constraint.location_2))
+                self.implied_constraints.add_edge_constraint(
+                    EdgeConstraint(constraint.time, constraint.location_2, constraint.location_1))
+        return self.implied_constraints
+
+    def violates_landmark(self, time, location):
+        locations = self.landmarks.get(time)
+        return locations is not None and (len(locations) > 1 or location not in locations)
+
+    def get_key(self):
+        """
+        Hashable summary of the constraint sets
+        """
+        return (frozenset(self.vertex_constraints), frozenset(self.edge_constraints),
+                frozenset(self.positive_vertex_constraints), frozenset(self.positive_edge_constraints),
+                frozenset(self.length_constraints), frozenset(self.target_constraints))
+
+    def has_vertex_constraint(self, time, location):
+        locations = self.vertex_table.get(time)
+        if locations is not None and location in locations:
+            return True
+        return bool(self.target_table) and self.target_table.get(location, time + 1) <= time
+
+    def has_edge_constraint(self, time, location_1, location_2):
+        edges = self.edge_table.get(time)
+        if edges is None:
+            return False
+        locations = edges.get(location_1)
+        return locations is not None and location_2 in locations
+
+    def get_last_vertex_time(self, location):
+        """
+        Latest time at which location is constrained, -1 if it never is
+        """
+        return self.last_vertex_time.get(location, -1)
+
+    def get_last_landmark_time(self, goal):
+        """
+        Latest time of a landmark elsewhere than goal, -1 if there is none.
+        Landmarks at the goal are kept by staying there, so they do not delay
+        the end of the path.
+        """
+        return max((time for time, locations in self.landmarks.items() if locations != {goal}), default=-1)
 
     def __str__(self):
         return "VC: " + str([str(vc) for vc in self.vertex_constraints])  + \
-            "EC: " + str([str(ec) for ec in self.edge_constraints])
+            "EC: " + str([str(ec) for ec in self.edge_constraints]) + \
+            "PVC: " + str([str(vc) for vc in self.positive_vertex_constraints]) + \
+            "PEC: " + str([str(ec) for ec in self.positive_edge_constraints]) + \
+            "LC: " + str(sorted(self.length_constraints)) + \
+            "TC: " + str([str(tc) for tc in self.target_constraints])
+
+class ConflictAvoidanceTable(object):
+    """
+    Space-time occupancy of the paths of other agents. The low level uses it
+    to prefer, among paths of equal cost, the ones with fewer conflicts.
+    """
+    def __init__(self):
+        self.vertex_table = {}
+        self.edge_table = {}
+        self.goal_table = {}
+
+    @classmethod
+    def from_solution(cls, solution, exclude=None):
+        table = cls()
+        for agent, path in solution.items():
+            if agent != exclude:
+                table.add_path(path)
+        return table
+
+    def add_path(self, path):
+        for state_1, state_2 in zip(path, path[1:]):
+            vertex = (state_1.time, state_1.location.x, state_1.location.y)
+            edge = vertex + (state_2.location.x, state_2.location.y)
+            self.vertex_table[vertex] = self.vertex_table.get(vertex, 0) + 1
+            self.edge_table[edge] = self.edge_table.get(edge, 0) + 1
+        # The agent stays at its goal once the path ends
+        goal = path[-1]
+        self.goal_table.setdefault((goal.location.x, goal.location.y), []).append(goal.time)
+
+    def count_conflicts(self, state_1, state_2):
+        """
+        Number of conflicts caused by the transition from state_1 to state_2
+        """
+        x, y = state_2.location.x, state_2.location.y
+        num_conflicts = self.vertex_table.get((state_2.time, x, y), 0)
+        num_conflicts += sum(1 for t in self.goal_table.get((x, y), ()) if t <= state_2.time)
+        if not state_1.is_equal_except_time(state_2):
+            edge = (state_1.time, x, y, state_1.location.x, state_1.location.y)
+            num_conflicts += self.edge_table.get(edge, 0)
+        return num_conflicts
+
+class HeuristicTables(dict):
+    """
+    Distance tables of the goals of the agents, by agent, each computed or
+    loaded from the cache on its first lookup
+    """
+    def __init__(self, distance_table, agent_dict):
+        dict.__init__(self)
+        self.distance_table = distance_table
+        self.agent_dict = agent_dict
+
+    def __missing__(self, agent):
+        goal = self.agent_dict[agent]['goal'].location
+        table = self[agent] = self.distance_table.get_table((goal.x, goal.y))
+        return table
 
 class Environment(object):
-    def __init__(self, dimension, agents, obstacles):
+    def __init__(self, dimension, agents, obstacles, heuristic_cache=None):
         self.dimension = dimension
         self.obstacles = obstacles
 
@@ -103,10 +371,19 @@ class Environment(object):
 
         self.make_agent_dict()
 
+        self.grid = OccupancyGrid.for_map(dimension, obstacles)
+
+        # Agents sharing a goal share its distance table
+        self.distance_table = DistanceTable.for_grid(self.grid, heuristic_cache)
+        self.heuristic_tables = HeuristicTables(self.distance_table, self.agent_dict)
+
         self.constraints = Constraints()
         self.constraint_dict = {}
+        self.conflict_avoidance_table = None
+        self.bypass_tables = {}
 
         self.a_star = AStar(self)
+        self.joint_a_star = JointAStar(self)
 
     def get_neighbors(self, state):
         neighbors = []
@@ -115,63 +392,123 @@ class Environment(object):
         n = State(state.time + 1, state.location)
         if self.state_valid(n):
             neighbors.append(n)
-        # Up action
-        n = State(state.time + 1, Location(state.location.x, state.location.y+1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Down action
-        n = State(state.time + 1, Location(state.location.x, state.location.y-1))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Left action
-        n = State(state.time + 1, Location(state.location.x-1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
-        # Right action
-        n = State(state.time + 1, Location(state.location.x+1, state.location.y))
-        if self.state_valid(n) and self.transition_valid(state, n):
-            neighbors.append(n)
+        # Up, down, left and right actions into free cells
+        for x, y in self.grid.get_neighbours((state.location.x, state.location.y)):
+            n = State(state.time + 1, Location(x, y))
+            if self.state_valid(n) and self.transition_valid(state, n):
+                neighbors.append(n)
         return neighbors
 
-        
     def get_first_conflict(self, solution):
+        return next(self.iter_conflicts(solution), False)
+
+    def get_all_conflicts(self, solution):
+        return list(self.iter_conflicts(solution))
+
+    def count_conflicts(self, solution):
+        return sum(1 for _ in self.iter_conflicts(solution))
+
+    def iter_conflicts(self, solution):
+        """
+        Generate the conflicts of a solution ordered by time, vertex conflicts
+        before edge conflicts. Each timestep is indexed by occupied cell and
+        traversed edge, so a scan costs O(N*T) instead of O(N^2*T).
+        """
         max_t = max([len(plan) for plan in solution.values()])
-        result = Conflict()
         for t in range(max_t):
-            for agent_1, agent_2 in combinations(solution.keys(), 2):
-                state_1 = self.get_state(agent_1, solution, t)
-                state_2 = self.get_state(agent_2, solution, t)
-                if state_1.is_equal_except_time(state_2):
+            vertex_index = {}
+            edge_index = {}
+            for agent, path in solution.items():
+                state_a = path[min(t, len(path)-1)]
+                state_b = path[min(t+1, len(path)-1)]
+                vertex = (state_a.location.x, state_a.location.y)
+                next_vertex = (state_b.location.x, state_b.location.y)
+                vertex_index.setdefault(vertex, []).append(agent)
+                if vertex != next_vertex:
+                    edge_index.setdefault((vertex, next_vertex), []).append((agent, state_a, state_b))
+
+            for agents in vertex_index.values():
+                for agent_1, agent_2 in combinations(agents, 2):
+                    result = Conflict()
                     result.time = t
                     result.type = Conflict.VERTEX
-                    result.location_1 = state_1.location
+                    result.location_1 = self.get_state(agent_1, solution, t).location
                     result.agent_1 = agent_1
                     result.agent_2 = agent_2
-                    return result
-
-            for agent_1, agent_2 in combinations(solution.keys(), 2):
-                state_1a = self.get_state(agent_1, solution, t)
-                state_1b = self.get_state(agent_1, solution, t+1)
+                    yield result
 
-                state_2a = self.get_state(agent_2, solution, t)
-                state_2b = self.get_state(agent_2, solution, t+1)
+            for (vertex, next_vertex), moves in edge_index.items():
+                # Every swap is seen from both sides, report it once
+                if vertex > next_vertex:
+                    continue
+                for agent_1, state_1a, state_1b in moves:
+                    for agent_2, _, _ in edge_index.get((next_vertex, vertex), ()):
+                        result = Conflict()
+                        result.time = t
+                        result.type = Conflict.EDGE
+                        result.agent_1 = agent_1
+                        result.agent_2 = agent_2
+                        result.location_1 = state_1a.location
+                        result.location_2 = state_1b.location
+                        yield result
 
+    def get_agent_conflicts(self, agent, solution):
+        """
+        Conflicts between the path of one agent and every other path
+        """
+        conflicts = []
+        path = solution[agent]
+        for other, other_path in solution.items():
+            if other == agent:
+                continue
+            for t in range(max(len(path), len(other_path))):
+                state_1a = path[min(t, len(path)-1)]
+                state_2a = other_path[min(t, len(other_path)-1)]
+                if state_1a.is_equal_except_time(state_2a):
+                    result = Conflict()
+                    result.time = t
+                    result.type = Conflict.VERTEX
+                    result.location_1 = state_1a.location
+                    result.agent_1 = agent
+                    result.agent_2 = other
+                    conflicts.append(result)
+                    continue
+                state_1b = path[min(t+1, len(path)-1)]
+                state_2b = other_path[min(t+1, len(other_path)-1)]
                 if state_1a.is_equal_except_time(state_2b) and state_1b.is_equal_except_time(state_2a):
+                    result = Conflict()
                     result.time = t
                     result.type = Conflict.EDGE
-                    result.agent_1 = agent_1
-                    result.agent_2 = agent_2
+                    result.agent_1 = agent
+                    result.agent_2 = other
                     result.location_1 = state_1a.location
                     result.location_2 = state_1b.location
-                    return result                
-        return False
+                    conflicts.append(result)
+        return conflicts
+
+    def create_constraints_from_conflict(self, conflict, solution=None, target_reasoning=True,
+                                         symmetry_reasoning=True):
+        """
+        Constraints of the two children of a conflict. Given the solution,
+        target conflicts are split on the length of the path of the agent at
+        its goal, and rectangle and corridor conflicts are resolved at once by
+        symmetry reasoning instead of one timestep at a time.
+        """
+        if solution is not None:
+            constraint_dict = None
+            if target_reasoning:
+                constraint_dict = self.get_target_constraints(conflict, solution)
+            if not constraint_dict and symmetry_reasoning:
+                constraint_dict = self.get_rectangle_constraints(conflict, solution) or \
+                    self.get_corridor_constraints(conflict, solution)
+            if constraint_dict:
+                return constraint_dict
 
-    def create_constraints_from_conflict(self, conflict):
         constraint_dict = {}
         if conflict.type == Conflict.VERTEX:
             v_constraint = VertexConstraint(conflict.time, conflict.location_1)
             constraint = Constraints()
-            constraint.vertex_constraints |= {v_constraint}
+            constraint.add_vertex_constraint(v_constraint)
             constraint_dict[conflict.agent_1] = constraint
             constraint_dict[conflict.agent_2] = constraint
         
@@ -182,37 +519,276 @@ class Environment(object):
             e_constraint1 = EdgeConstraint(conflict.time, conflict.location_1, conflict.location_2)
             e_constraint2 = EdgeConstraint(conflict.time, conflict.location_2, conflict.location_1)
         
-            constraint1.edge_constraints |= {e_constraint1}
-            constraint2.edge_constraints |= {e_constraint2}
+            constraint1.add_edge_constraint(e_constraint1)
+            constraint2.add_edge_constraint(e_constraint2)
 
             constraint_dict[conflict.agent_1] = constraint1
             constraint_dict[conflict.agent_2] = constraint2
 
         return constraint_dict
 
+    def get_target_constraints(self, conflict, solution):
+        """
+        Target reasoning: an agent runs into another one that already sits at
+        its goal for good. Either the path of the agent at its goal finishes
+        after the conflict, or it finishes before and the other agent may
+        never use that goal again. None if the conflict is not a target
+        conflict.
+
+        See the article: New Techniques for Pairwise Symmetry Breaking in
+        Multi-Agent Path Finding (Li et al.), ICAPS 2020
+        """
+        if conflict.type != Conflict.VERTEX:
+            return None
+        for finished, other in ((conflict.agent_1, conflict.agent_2), (conflict.agent_2, conflict.agent_1)):
+            path = solution[finished]
+            if conflict.time >= len(path) - 1 and path[-1].location == conflict.location_1:
+                length_constraint = Constraints()
+                length_constraint.add_length_constraint(conflict.time)
+                target_constraint = Constraints()
+                target_constraint.add_target_constraint(VertexConstraint(conflict.time, conflict.location_1))
+                return {finished: length_constraint, other: target_constraint}
+        return None
+
+    def get_rectangle_constraints(self, conflict, solution):
+        """
+        Rectangle reasoning: two agents on Manhattan-optimal paths that meet
+        in a vertex conflict meet again wherever they cross the rectangle
+        between their starts and goals. One of them has to be late at the
+        far border of the rectangle, which barrier constraints enforce.
+        None if the conflict is not a rectangle conflict.
+
+        See the article: Symmetry-Breaking Constraints for Grid-Based
+        Multi-Agent Path Finding (Li et al.), AAAI 2019
+        """
+        if conflict.type != Conflict.VERTEX:
+            return None
+        agents = (conflict.agent_1, conflict.agent_2)
+        starts = []
+        goals = []
+        for agent in agents:
+            path = solution[agent]
+            start, goal = path[0].location, path[-1].location
+            # Both agents have to be on their way, not waiting at their goal
+            if len(path) - 1 != abs(goal.x - start.x) + abs(goal.y - start.y) or conflict.time >= len(path):
+                return None
+            starts.append((start.x, start.y))
+            goals.append((goal.x, goal.y))
+
+        # Mirror the axes so that both agents move towards increasing x and y
+        flip = []
+        for axis in (0, 1):
+            direction_1 = goals[0][axis] - starts[0][axis]
+            direction_2 = goals[1][axis] - starts[1][axis]
+            if direction_1 * direction_2 < 0:
+                return None
+            flip.append(-1 if direction_1 < 0 or direction_2 < 0 else 1)
+        mirror = lambda cell: (cell[0] * flip[0], cell[1] * flip[1])
+        starts = [mirror(start) for start in starts]
+        goals = [mirror(goal) for goal in goals]
+
+        rectangle_start = (max(starts[0][0], starts[1][0]), max(starts[0][1], starts[1][1]))
+        rectangle_goal = (min(goals[0][0], goals[1][0]), min(goals[0][1], goals[1][1]))
+        if rectangle_start == rectangle_goal:
+            return None
+        # Meeting on time means that one agent enters the rectangle from
+        # below and crosses its top border, the other one enters it from the
+        # left and crosses its right border
+        if starts[0][0] == rectangle_start[0] and starts[1][1] == rectangle_start[1]:
+            vertical = 0
+        elif starts[1][0] == rectangle_start[0] and starts[0][1] == rectangle_start[1]:
+            vertical = 1
+        else:
+            return None
+        top = [(x, rectangle_goal[1]) for x in range(rectangle_start[0], rectangle_goal[0] + 1)]
+        right = [(rectangle_goal[0], y) for y in range(rectangle_start[1], rectangle_goal[1] + 1)]
+
+        constraint_dict = {}
+        for index, border in ((vertical, top), (1 - vertical, right)):
+            start_time = abs(border[0][0] - starts[index][0]) + abs(border[0][1] - starts[index][1])
+            locations = [Location(*mirror(cell)) for cell in border]
+            # The split only resolves the conflict if both paths cross their barrier
+            path = solution[agents[index]]
+            if not any(path[start_time + i].location == location
+                       for i, location in enumerate(locations) if start_time + i < len(path)):
+                return None
+            constraints = Constraints()
+            constraints.add_barrier_constraint(locations, start_time)
+            constraint_dict[agents[index]] = constraints
+        return constraint_dict
+
+    def get_corridor_constraints(self, conflict, solution):
+        """
+        Corridor reasoning: two agents crossing a corridor in opposite
+        directions conflict unless one of them leaves it before the other
+        enters. Either agent reaches its exit of the corridor only after the
+        other one could have crossed it, which range constraints on the exits
+        enforce. None if the conflict is not a corridor conflict.
+
+        See the article: New Techniques for Pairwise Symmetry Breaking in
+        Multi-Agent Path Finding (Li et al.), ICAPS 2020
+        """
+        corridor = self.grid.get_corridor((conflict.location_1.x, conflict.location_1.y))
+        if corridor is None or len(corridor) < 2:
+            return None
+        if conflict.type == Conflict.EDGE and (conflict.location_2.x, conflict.location_2.y) not in corridor:
+            return None
+
+        agents = (conflict.agent_1, conflict.agent_2)
+        traversals = []
+        for agent in agents:
+            start = self.agent_dict[agent]["start"].location
+            if (start.x, start.y) in corridor[1:-1]:
+                return None
+            traversal = self.get_corridor_traversal(solution[agent], corridor, conflict.time)
+            if traversal is None:
+                return None
+            traversals.append(traversal)
+        (entry_1, exit_1), (entry_2, exit_2) = traversals
+        if entry_1 != exit_2 or exit_1 != entry_2:
+            return None
+
+        length = len(corridor) - 1
+        constraint_dict = {}
+        for index, agent in enumerate(agents):
+            exit, other_exit = traversals[index][1], traversals[1 - index][1]
+            start = self.agent_dict[agent]["start"].location
+            other_start = self.agent_dict[agents[1 - index]]["start"].location
+            # Being at the exit earlier than any bypass allows means coming
+            # through the corridor
+            end_time = int(min(self.get_bypass_distance(corridor, exit, (start.x, start.y)) - 1,
+                               self.distance_table.get_distance((other_start.x, other_start.y), other_exit) + length))
+            path = solution[agent]
+            if not any((path[t].location.x, path[t].location.y) == exit for t in range(min(end_time, len(path) - 1) + 1)):
+                return None
+            constraints = Constraints()
+            constraints.add_range_constraint(Location(*exit), 0, end_time)
+            constraint_dict[agent] = constraints
+        return constraint_dict
+
+    def get_corridor_traversal(self, path, corridor, time):
+        """
+        Entry and exit of the passage of a path through the corridor at the
+        given time, None unless it goes from one end to the other
+        """
+        cells = set(corridor)
+        location = lambda t: (path[min(t, len(path)-1)].location.x, path[min(t, len(path)-1)].location.y)
+        if location(time) not in cells:
+            return None
+        first = time
+        while first > 0 and location(first - 1) in cells:
+            first -= 1
+        last = time
+        while last < len(path) - 1 and location(last + 1) in cells:
+            last += 1
+        entry, exit = location(first), location(last)
+        if entry == exit or entry not in (corridor[0], corridor[-1]) or exit not in (corridor[0], corridor[-1]):
+            return None
+        return entry, exit
+
+    def get_bypass_distance(self, corridor, exit, position):
+        """
+        Distance from a position to an exit of the corridor without going
+        through the corridor
+        """
+        table = self.bypass_tables.get((corridor, exit))
+        if table is None:
+            # The other cells of the corridor can be reached but not crossed
+            blocked = set(corridor)
+            blocked.discard(exit)
+            table = {exit: 0}
+            queue = deque([exit])
+            while queue:
+                cell = queue.popleft()
+                for neighbour in self.grid.get_neighbours(cell):
+                    if neighbour not in table:
+                        table[neighbour] = table[cell] + 1
+                        if neighbour not in blocked:
+                            queue.append(neighbour)
+            self.bypass_tables[(corridor, exit)] = table
+        return table.get(position, float("inf"))
+
+    def create_disjoint_constraints_from_conflict(self, conflict):
+        """
+        Disjoint splitting: agent_1 must pass through the conflict in one
+        child and may not in the other, so the two subtrees never share a
+        solution. Returns a list of (agent, constraints) pairs.
+        """
+        positive = Constraints()
+        negative = Constraints()
+        if conflict.type == Conflict.VERTEX:
+            positive.add_positive_vertex_constraint(VertexConstraint(conflict.time, conflict.location_1))
+            negative.add_vertex_constraint(VertexConstraint(conflict.time, conflict.location_1))
+        elif conflict.type == Conflict.EDGE:
+            positive.add_positive_edge_constraint(EdgeConstraint(conflict.time, conflict.location_1, conflict.location_2))
+            negative.add_edge_constraint(EdgeConstraint(conflict.time, conflict.location_1, conflict.location_2))
+        return [(conflict.agent_1, positive), (conflict.agent_1, negative)]
+
+    def path_satisfies(self, path, constraints):
+        """
+        Check a path, including the agent staying at its goal, against constraints
+        """
+        for constraint in constraints.vertex_constraints:
+            if path[min(constraint.time, len(path)-1)].location == constraint.location:
+                return False
+        for constraint in constraints.edge_constraints:
+            if constraint.time + 1 < len(path) and path[constraint.time].location == constraint.location_1 \
+                    and path[constraint.time + 1].location == constraint.location_2:
+                return False
+        for t in constraints.landmarks:
+            if constraints.violates_landmark(t, path[min(t, len(path)-1)].location):
+                return False
+        if len(path) - 1 < constraints.min_goal_time:
+            return False
+        for location, t in constraints.target_table.items():
+            # The agent also occupies the end of its path for good
+            if path[-1].location == location or any(state.location == location for state in path[t:]):
+                return False
+        return True
+
     def get_state(self, agent_name, solution, t):
         if t < len(solution[agent_name]):
             return solution[agent_name][t]
         else:
             return solution[agent_name][-1]
 
+    def state_key(self, state):
+        """
+        Pack a state into the integer t*W*H + y*W + x. Past the last
+        constraint every timestep looks the same, so the time is capped there,
+        which keeps the search finite when the goal cannot be reached.
+        """
+        time = min(state.time, self.constraints.max_time + 1)
+        return (time * self.dimension[1] + state.location.y) * self.dimension[0] + state.location.x
+
     def state_valid(self, state):
-        return state.location.x >= 0 and state.location.x < self.dimension[0] \
-            and state.location.y >= 0 and state.location.y < self.dimension[1] \
-            and VertexConstraint(state.time, state.location) not in self.constraints.vertex_constraints \
-            and (state.location.x, state.location.y) not in self.obstacles
+        return self.grid.is_free((state.location.x, state.location.y)) \
+            and not self.constraints.has_vertex_constraint(state.time, state.location) \
+            and not self.constraints.violates_landmark(state.time, state.location)
 
     def transition_valid(self, state_1, state_2):
-        return EdgeConstraint(state_1.time, state_1.location, state_2.location) not in self.constraints.edge_constraints
+        return not self.constraints.has_edge_constraint(state_1.time, state_1.location, state_2.location)
+
+    def avoidance_conflicts(self, state_1, state_2):
+        if self.conflict_avoidance_table is None:
+            return 0
+        return self.conflict_avoidance_table.count_conflicts(state_1, state_2)
 
     def is_solution(self, agent_name):
         pass
 
     def admissible_heuristic(self, state, agent_name):
-        goal = self.agent_dict[agent_name]["goal"]
-        return fabs(state.location.x - goal.location.x) + fabs(state.location.y - goal.location.y)
+        return self.heuristic_tables[agent_name][state.location.x, state.location.y]
 
 
+    def earliest_goal_time(self, agent_name):
+        """
+        Earliest time from which the agent may stay at its goal for good
+        """
+        goal_state = self.agent_dict[agent_name]["goal"]
+        return max(self.constraints.get_last_vertex_time(goal_state.location) + 1,
+                   self.constraints.get_last_landmark_time(goal_state.location), self.constraints.min_goal_time)
+
     def is_at_goal(self, state, agent_name):
         goal_state = self.agent_dict[agent_name]["goal"]
         return state.is_equal_except_time(goal_state)
@@ -227,70 +803,507 @@ class Environment(object):
     def compute_solution(self):
         solution = {}
         for agent in self.agent_dict.keys():
-            self.constraints = self.constraint_dict.setdefault(agent, Constraints())
-            local_solution = self.a_star.search(agent)
+            local_solution = self.compute_agent_solution(agent)
             if not local_solution:
                 return False
             solution.update({agent:local_solution})
+            if self.conflict_avoidance_table is not None:
+                self.conflict_avoidance_table.add_path(local_solution)
         return solution
 
+    def compute_agent_solution(self, agent, constraints=None):
+        """
+        Plan a single agent, by default under its entry in constraint_dict
+        """
+        if constraints is None:
+            constraints = self.constraint_dict.setdefault(agent, Constraints())
+        self.constraints = constraints
+        return self.a_star.search(agent)
+
+    def compute_focal_agent_solution(self, agent, suboptimality, constraints=None):
+        """
+        Plan a single agent within suboptimality of its optimal cost, returns
+        the path and a lower bound on the optimal cost
+        """
+        if constraints is None:
+            constraints = self.constraint_dict.setdefault(agent, Constraints())
+        self.constraints = constraints
+        return self.a_star.focal_search(agent, suboptimality)
+
+    def compute_meta_agent_solution(self, agents, constraint_dict, budget=None):
+        """
+        Plan a group of agents together with the coupled low level, returns
+        a dict of paths, False if there are none or the budget runs out
+        """
+        return self.joint_a_star.search(agents, constraint_dict, budget)
+
     def compute_solution_cost(self, solution):
         return sum([len(path) for path in solution.values()])
 
 class HighLevelNode(object):
-    def __init__(self):
-        self.solution = {}
-        self.constraint_dict = {}
-        self.cost = 0
+    """
+    Node of the constraint tree. A node only stores the constraint it adds
+    to its parent; the constraints of an agent are collected along the path
+    to the root when they are needed. The solution dict is copied
+    shallowly, so paths that are not replanned are shared with the parent.
+    The conflicts of the node are derived from the parent's in the same way.
+    Meta-agents of MA-CBS map each merged agent to its group.
+    """
+    def __init__(self, parent=None, agent=None, constraint=None):
+        self.parent = parent
+        self.agent = agent
+        self.constraint = constraint
+        self.solution = {} if parent is None else dict(parent.solution)
+        self.cost = 0 if parent is None else parent.cost
+        self.h = 0
+        self.conflicts = []
+        self.num_conflicts = 0
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.meta_agents = {} if parent is None else parent.meta_agents
+
+    def get_meta_agent(self, agent):
+        return self.meta_agents.get(agent, (agent,))
+
+    def get_constraints(self, agent):
+        constraints = Constraints()
+        for constraint in self.get_constraint_list(agent):
+            constraints.add_constraint(constraint)
+        return constraints
+
+    def get_constraint_list(self, agent):
+        """
+        Constraints added for the agent along the path to the root, unmerged
+        """
+        constraint_list = []
+        node = self
+        while node.parent is not None:
+            if node.agent == agent:
+                constraint_list.append(node.constraint)
+            elif node.constraint.has_positive_constraints():
+                constraint_list.append(node.constraint.get_implied_constraints())
+            node = node.parent
+        return constraint_list
+
+    @property
+    def constraint_dict(self):
+        constraint_dict = {agent: Constraints() for agent in self.solution}
+        node = self
+        while node.parent is not None:
+            constraint_dict[node.agent].add_constraint(node.constraint)
+            if node.constraint.has_positive_constraints():
+                for agent, constraints in constraint_dict.items():
+                    if agent != node.agent:
+                        constraints.add_constraint(node.constraint.get_implied_constraints())
+            node = node.parent
+        return constraint_dict
 
     def __lt__(self, other):
         return self.cost < other.cost
 
+class TieBreaking(object):
+    """
+    Priority keys of the high-level open list. Every key starts with the
+    f-value, the solution cost plus the high-level heuristic, so the policies
+    only differ on nodes of equal f-value.
+    """
+    @staticmethod
+    def conflicts(node):
+        return (node.cost + node.h, node.num_conflicts, -node.depth)
+
+    @staticmethod
+    def depth(node):
+        return (node.cost + node.h, -node.depth)
+
+    @staticmethod
+    def fifo(node):
+        return (node.cost + node.h,)
+
+TIE_BREAKING = {
+    'conflicts': TieBreaking.conflicts,
+    'depth': TieBreaking.depth,
+    'fifo': TieBreaking.fifo
+}
+
+class OpenList(object):
+    """
+    Binary heap of high-level nodes. Entries equal under the key are popped
+    in insertion order, which keeps the search deterministic.
+    """
+    def __init__(self, key=TieBreaking.conflicts):
+        self.key = key
+        self.heap = []
+        self.counter = 0
+
+    def push(self, node):
+        heappush(self.heap, (self.key(node), self.counter, node))
+        self.counter += 1
+
+    def pop(self):
+        return heappop(self.heap)[-1]
+
+    def __len__(self):
+        return len(self.heap)
+
+class SearchBudget(object):
+    """
+    Wall-clock (seconds) and expanded node budget of a search, unlimited by
+    default
+    """
+    def __init__(self, time_limit=None, node_limit=None):
+        self.deadline = None if time_limit is None else time.time() + time_limit
+        self.node_limit = node_limit
+        self.expanded = 0
+
+    def exhausted(self):
+        return self.out_of_time() or (self.node_limit is not None and self.expanded >= self.node_limit)
+
+    def out_of_time(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
 class CBS(object):
-    def __init__(self, environment):
+    node_class = HighLevelNode
+
+    def __init__(self, environment, tie_breaking='conflicts', incremental=True, conflict_avoidance=True,
+                 prioritize_conflicts=True, bypass=False, disjoint_splitting=False, merge_threshold=None,
+                 max_meta_agent_size=2, heuristic='cg', symmetry_reasoning=True, target_reasoning=True):
         self.env = environment 
-        self.open_set = set()
-    def search(self):
-        start = HighLevelNode()
-        # TODO: Initialize it in a better way
-        start.constraint_dict = {}
-        for agent in self.env.agent_dict.keys():
-            start.constraint_dict[agent] = Constraints()
+        # Meta-agents are replanned on their own, never by the full replan
+        self.incremental = incremental or merge_threshold is not None
+        self.conflict_avoidance = conflict_avoidance
+        self.prioritize_conflicts = prioritize_conflicts
+        self.bypass = bypass
+        self.disjoint_splitting = disjoint_splitting
+        self.merge_threshold = merge_threshold
+        self.max_meta_agent_size = max_meta_agent_size
+        self.conflict_counts = {}
+        self.heuristic = heuristic
+        self.symmetry_reasoning = symmetry_reasoning
+        self.target_reasoning = target_reasoning
+        self.pair_weight_cache = {}
+        self.mdd_cache = {}
+        self.budget = SearchBudget()
+        if not callable(tie_breaking):
+            tie_breaking = TIE_BREAKING[tie_breaking]
+        self.open_set = OpenList(tie_breaking)
+
+    def search(self, time_limit=None, node_limit=None):
+        """
+        Returns the plan, or {} if there is none or if the time (in seconds)
+        or expanded node budget runs out first
+        """
+        budget = self.budget = SearchBudget(time_limit, node_limit)
+        start = self.create_root()
+        if start is None:
+            return {}
+        self.open_set.push(start)
+
+        while self.open_set:
+            if budget.exhausted():
+                return {}
+            P = self.open_set.pop()
+
+            if not P.conflicts:
+                print("solution found")
+
+                return self.generate_plan(P.solution)
+
+            budget.expanded += 1
+            # TODO: ending condition 
+            for new_node in self.expand(P):
+                self.open_set.push(new_node)
+
+        return {}
+
+    def expand(self, P):
+        """
+        Split a node on one of its conflicts, returns the nodes to push: its
+        children, or the node itself after a bypass or a merge
+        """
+        conflict = self.select_conflict(P)
+        if self.merge_threshold is not None and self.should_merge(P, conflict):
+            # MA-CBS: the node keeps its constraints and the two agents
+            # are planned together from now on
+            if self.merge_agents(P, conflict.agent_1, conflict.agent_2):
+                return [P]
+            return []
+
+        if self.disjoint_splitting:
+            branches = self.env.create_disjoint_constraints_from_conflict(conflict)
+        else:
+            branches = self.env.create_constraints_from_conflict(conflict, P.solution, self.target_reasoning,
+                                                                 self.symmetry_reasoning).items()
+        return self.generate_children(P, branches)
+
+    def generate_children(self, P, branches):
+        """
+        Children of P for each (agent, constraint) branch, or P itself after a
+        bypass
+        """
+        children = []
+        for agent, constraint in branches:
+            new_node = self.generate_child(P, agent, constraint)
+            if new_node is None:
+                continue
+            if self.bypass and new_node.cost == P.cost and new_node.num_conflicts < P.num_conflicts:
+                # Bypass: keep the better solution in P instead of branching
+                P.solution = new_node.solution
+                P.conflicts = new_node.conflicts
+                P.num_conflicts = new_node.num_conflicts
+                return [P]
+            children.append(new_node)
+        return children
+
+    def create_root(self):
+        """
+        Root of the constraint tree, None if an agent cannot reach its goal
+        """
+        start = self.node_class()
+        self.env.constraint_dict = {}
+        if self.conflict_avoidance:
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable()
         start.solution = self.env.compute_solution()
         if not start.solution:
-            return {}
+            return None
         start.cost = self.env.compute_solution_cost(start.solution)
+        start.conflicts = self.env.get_all_conflicts(start.solution)
+        start.num_conflicts = len(start.conflicts)
+        start.h = self.compute_heuristic(start)
+        return start
 
-        self.open_set |= {start}
+    def generate_child(self, P, agent, constraint):
+        """
+        Child of P in which agent receives the new constraint, None if an
+        agent can no longer reach its goal
+        """
+        new_node = self.node_class(P, agent, constraint)
 
-        while self.open_set:
-            P = min(self.open_set)
-            self.open_set -= {P}
+        if self.incremental:
+            # Only agents whose paths break the new constraint are replanned:
+            # the constrained agent for a negative constraint, the agents in
+            # the way for a positive one
+            replanned = []
+            for other, path in P.solution.items():
+                if other == agent:
+                    violated = not self.env.path_satisfies(path, constraint)
+                else:
+                    violated = constraint.has_positive_constraints() and \
+                        not self.env.path_satisfies(path, constraint.get_implied_constraints())
+                if violated:
+                    replanned.append(other)
 
-            self.env.constraint_dict = P.constraint_dict
-            conflict_dict = self.env.get_first_conflict(P.solution)
+            # Meta-agents are replanned as a whole
+            groups = []
+            for other in replanned:
+                group = new_node.get_meta_agent(other)
+                if group not in groups:
+                    groups.append(group)
+            replanned = [other for group in groups for other in group]
 
-            if not conflict_dict:
-                print("solution found")
+            for group in groups:
+                if len(group) == 1:
+                    if not self.replan_agent(new_node, group[0]):
+                        return None
+                elif not self.replan_meta_agent(new_node, group):
+                    return None
 
-                return self.generate_plan(P.solution)
+            new_node.conflicts = [c for c in P.conflicts if c.agent_1 not in replanned and c.agent_2 not in replanned]
+            for i, other in enumerate(replanned):
+                # Conflicts between two replanned agents are only added once
+                new_node.conflicts += [c for c in self.env.get_agent_conflicts(other, new_node.solution)
+                                       if c.agent_2 not in replanned[:i]]
+        else:
+            if self.conflict_avoidance:
+                # compute_solution fills the table as the agents are planned
+                self.env.conflict_avoidance_table = ConflictAvoidanceTable()
+            self.env.constraint_dict = new_node.constraint_dict
+            new_node.solution = self.env.compute_solution()
+            if not new_node.solution:
+                return None
+            new_node.cost = self.env.compute_solution_cost(new_node.solution)
+            new_node.conflicts = self.env.get_all_conflicts(new_node.solution)
+        new_node.num_conflicts = len(new_node.conflicts)
+        new_node.h = self.compute_heuristic(new_node)
+        return new_node
 
-            constraint_dict = self.env.create_constraints_from_conflict(conflict_dict)
+    def replan_agent(self, node, agent):
+        """
+        Replan one agent of the node under its constraints, False if it can
+        no longer reach its goal
+        """
+        if self.conflict_avoidance:
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable.from_solution(node.solution, agent)
+        path = self.env.compute_agent_solution(agent, node.get_constraints(agent))
+        if not path:
+            return False
+        node.cost += len(path) - len(node.solution[agent])
+        node.solution[agent] = path
+        return True
 
-            for agent in constraint_dict.keys():
-                new_node = deepcopy(P)
-                new_node.constraint_dict[agent].add_constraint(constraint_dict[agent]) 
-                
-                self.env.constraint_dict = new_node.constraint_dict
-                new_node.solution = self.env.compute_solution()
-                if not new_node.solution:
-                    continue
-                new_node.cost = self.env.compute_solution_cost(new_node.solution)
+    def replan_meta_agent(self, node, group):
+        """
+        Replan the agents of a meta-agent together under their constraints
+        """
+        if self.conflict_avoidance:
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable.from_solution(
+                {agent: path for agent, path in node.solution.items() if agent not in group})
+        paths = self.env.compute_meta_agent_solution(group, {agent: node.get_constraints(agent) for agent in group},
+                                                     self.budget)
+        if not paths:
+            return False
+        for agent, path in paths.items():
+            node.cost += len(path) - len(node.solution[agent])
+            node.solution[agent] = path
+        return True
 
-                # TODO: ending condition 
-                self.open_set |= {new_node}
+    def should_merge(self, node, conflict):
+        """
+        Count the conflict between the two agents, over the whole constraint
+        tree, and tell whether their meta-agents conflicted more than the
+        merge threshold. Meta-agents that would grow past the maximum size
+        keep being split instead: proving that a large group cannot reach
+        its goals together means searching all of its joint states.
+        """
+        pair = frozenset((conflict.agent_1, conflict.agent_2))
+        self.conflict_counts[pair] = self.conflict_counts.get(pair, 0) + 1
+        num_conflicts = sum(self.conflict_counts.get(frozenset((agent_1, agent_2)), 0)
+                            for agent_1 in node.get_meta_agent(conflict.agent_1)
+                            for agent_2 in node.get_meta_agent(conflict.agent_2))
+        size = len(node.get_meta_agent(conflict.agent_1)) + len(node.get_meta_agent(conflict.agent_2))
+        return num_conflicts > self.merge_threshold and size <= self.max_meta_agent_size
 
-        return {}
+    def merge_agents(self, node, agent_1, agent_2):
+        """
+        Merge the meta-agents of the two agents in the node and replan them
+        jointly, False if they cannot reach their goals together
+        """
+        group = node.get_meta_agent(agent_1) + node.get_meta_agent(agent_2)
+        node.meta_agents = dict(node.meta_agents)
+        for agent in group:
+            node.meta_agents[agent] = group
+        if not self.replan_meta_agent(node, group):
+            return False
+        node.conflicts = [c for c in node.conflicts if c.agent_1 not in group and c.agent_2 not in group]
+        for i, agent in enumerate(group):
+            node.conflicts += [c for c in self.env.get_agent_conflicts(agent, node.solution)
+                               if c.agent_2 not in group[:i]]
+        node.num_conflicts = len(node.conflicts)
+        # The cost of the merged agents now includes their joint cost increase
+        node.h = self.compute_heuristic(node)
+        return True
+
+    def compute_heuristic(self, node):
+        """
+        Admissible estimate of the cost increase needed to resolve the
+        conflicts of the node, the weighted vertex cover of the graph
+        over the conflicting pairs of agents
+        """
+        if self.heuristic == 'none' or not node.conflicts:
+            return 0
+        weights = {}
+        mdds = {}
+        for conflict in node.conflicts:
+            agent_1, agent_2 = sorted((conflict.agent_1, conflict.agent_2))
+            if weights.get((agent_1, agent_2)) or \
+                    (self.heuristic != 'cg' and (agent_1, agent_2) in weights):
+                continue
+            # Meta-agents are already planned jointly
+            if len(node.get_meta_agent(agent_1)) > 1 or len(node.get_meta_agent(agent_2)) > 1:
+                continue
+            if self.heuristic == 'cg':
+                weights[(agent_1, agent_2)] = int(self.classify_conflict(node, conflict, mdds) == Conflict.CARDINAL)
+            else:
+                weights[(agent_1, agent_2)] = self.get_pair_weight(node, agent_1, agent_2)
+        return weighted_vertex_cover(weights)
+
+    def get_pair_weight(self, node, agent_1, agent_2):
+        """
+        Edge weight of the dependency graph: 1 for dependent agents, or with
+        the weighted dependency graph, the extra cost of planning them jointly.
+        Weights only depend on the constraints of the two agents, so they are
+        cached per agent pair and constraint sets.
+        """
+        constraints_1 = node.get_constraints(agent_1)
+        constraints_2 = node.get_constraints(agent_2)
+        key = (agent_1,) + constraints_1.get_key() + (agent_2,) + constraints_2.get_key()
+        weight = self.pair_weight_cache.get(key)
+        if weight is not None:
+            return weight
+
+        if not are_dependent(self.get_mdd(node, agent_1), self.get_mdd(node, agent_2)):
+            weight = 0
+        elif self.heuristic == 'dg':
+            weight = 1
+        else:
+            conflict_avoidance_table = self.env.conflict_avoidance_table
+            self.env.conflict_avoidance_table = None
+            paths = self.env.compute_meta_agent_solution((agent_1, agent_2),
+                                                         {agent_1: constraints_1, agent_2: constraints_2},
+                                                         self.budget)
+            self.env.conflict_avoidance_table = conflict_avoidance_table
+            if not paths and self.budget.exhausted():
+                # The search stops anyway, the weight is not known
+                return 1
+            if paths:
+                weight = len(paths[agent_1]) + len(paths[agent_2]) \
+                    - len(node.solution[agent_1]) - len(node.solution[agent_2])
+            else:
+                # Dependent agents need at least one more step
+                weight = 1
+        self.pair_weight_cache[key] = weight
+        return weight
+
+    def select_conflict(self, node):
+        """
+        Pick the conflict to split on: the earliest one, vertex conflicts first.
+        With conflict prioritization, cardinal conflicts come before
+        semi-cardinal ones, which come before non-cardinal ones.
+        """
+        if not self.prioritize_conflicts:
+            return min(node.conflicts, key=lambda conflict: (conflict.time, conflict.type))
+        mdds = {}
+        return min(node.conflicts, key=lambda conflict: \
+            (self.classify_conflict(node, conflict, mdds), conflict.time, conflict.type))
+
+    def classify_conflict(self, node, conflict, mdds=None):
+        """
+        A conflict is cardinal for an agent if every shortest path of the agent
+        goes through it, so that resolving it increases the agent's cost
+        """
+        if mdds is None:
+            mdds = {}
+        for agent in (conflict.agent_1, conflict.agent_2):
+            if agent not in mdds:
+                mdds[agent] = self.get_mdd(node, agent)
+        mdd_1 = mdds[conflict.agent_1]
+        mdd_2 = mdds[conflict.agent_2]
+
+        if conflict.type == Conflict.VERTEX:
+            cardinal_1 = mdd_1.is_singleton(conflict.time, conflict.location_1)
+            cardinal_2 = mdd_2.is_singleton(conflict.time, conflict.location_1)
+        else:
+            cardinal_1 = mdd_1.is_singleton(conflict.time, conflict.location_1) \
+                and mdd_1.is_singleton(conflict.time + 1, conflict.location_2)
+            cardinal_2 = mdd_2.is_singleton(conflict.time, conflict.location_2) \
+                and mdd_2.is_singleton(conflict.time + 1, conflict.location_1)
+
+        if cardinal_1 and cardinal_2:
+            return Conflict.CARDINAL
+        if cardinal_1 or cardinal_2:
+            return Conflict.SEMI_CARDINAL
+        return Conflict.NON_CARDINAL
+
+    def get_mdd(self, node, agent):
+        """
+        MDD of the agent's path in the node. The optimal cost is determined by
+        the constraints, so MDDs are cached per agent and constraint set.
+        """
+        constraints = node.get_constraints(agent)
+        key = (agent,) + constraints.get_key()
+        mdd = self.mdd_cache.get(key)
+        if mdd is None:
+            mdd = MDD(self.env, agent, constraints, len(node.solution[agent]))
+            self.mdd_cache[key] = mdd
+        return mdd
 
     def generate_plan(self, solution):
         plan = {}
@@ -304,6 +1317,30 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("param", help="input file containing map and obstacles")
     parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--tie-breaking", choices=sorted(TIE_BREAKING), default='conflicts',
+                        help="ordering of high-level nodes of equal cost")
+    parser.add_argument("--full-replan", action="store_true",
+                        help="replan every agent in each child node instead of only the constrained one")
+    parser.add_argument("--no-cat", action="store_true",
+                        help="do not break low-level ties with the conflict avoidance table")
+    parser.add_argument("--no-prioritize", action="store_true",
+                        help="split on the earliest conflict instead of cardinal conflicts first")
+    parser.add_argument("--bypass", action="store_true",
+                        help="adopt equal-cost child paths with fewer conflicts instead of branching")
+    parser.add_argument("--disjoint", action="store_true",
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--merge-threshold", type=int, default=None,
+                        help="MA-CBS: merge two agents into a meta-agent once they conflicted more than this")
+    parser.add_argument("--max-meta-agent-size", type=int, default=2,
+                        help="MA-CBS: largest meta-agent, conflicts of larger ones are split")
+    parser.add_argument("--heuristic", choices=HEURISTICS, default='cg',
+                        help="high-level heuristic: conflict graph, dependency graph or weighted dependency graph")
+    parser.add_argument("--no-symmetry", action="store_true",
+                        help="split rectangle and corridor conflicts one timestep at a time")
+    parser.add_argument("--no-target", action="store_true",
+                        help="split conflicts with agents at their goal one timestep at a time")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
     args = parser.parse_args()
     
     # Read from input file
@@ -317,10 +1354,15 @@ def main():
     obstacles = param["map"]["obstacles"]
     agents = param['agents']
 
-    env = Environment(dimension, agents, obstacles)
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
 
     # Searching
-    cbs = CBS(env)
+    cbs = CBS(env, args.tie_breaking, incremental=not args.full_replan, conflict_avoidance=not args.no_cat,
+              prioritize_conflicts=not args.no_prioritize, bypass=args.bypass,
+              disjoint_splitting=args.disjoint, merge_threshold=args.merge_threshold,
+              max_meta_agent_size=args.max_meta_agent_size,
+              heuristic=args.heuristic, symmetry_reasoning=not args.no_symmetry,
+              target_reasoning=not args.no_target)
     solution = cbs.search()
     if not solution:
         print(" Solution not found" ) 
@@ -0,0 +1,192 @@
+"""
+
+Enhanced Conflict-Based Search (ECBS), a bounded-suboptimal variant of CBS
+
+See the article: Suboptimal Variants of the Conflict-Based Search Algorithm
+for the Multi-Agent Pathfinding Problem (Barer et al.), SoCS 2014
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import yaml
+from heapq import heappush, heappop
+
+from cbs.cbs import Environment, CBS, HighLevelNode, Constraints, ConflictAvoidanceTable
+
+class ECBSNode(HighLevelNode):
+    """
+    Constraint tree node that also keeps, per agent, a lower bound on the
+    optimal cost of its path under its constraints
+    """
+    def __init__(self, parent=None, agent=None, constraint=None):
+        HighLevelNode.__init__(self, parent, agent, constraint)
+        self.lower_bounds = {} if parent is None else dict(parent.lower_bounds)
+        self.lower_bound = 0 if parent is None else parent.lower_bound
+
+class FocalList(object):
+    """
+    High-level open list of ECBS. Nodes are popped from the focal list, the
+    open nodes whose cost is within suboptimality of the smallest lower
+    bound, by fewest conflicts. The smallest lower bound can decrease when a
+    sibling with a lower bound than its parent's other children is pushed,
+    so the head of the focal list is checked against the bound again when
+    popping and moved back to pending if it no longer is within it.
+    """
+    def __init__(self, suboptimality):
+        self.suboptimality = suboptimality
+        self.open_heap = []
+        self.focal_heap = []
+        self.pending_heap = []
+        self.removed = set()
+        self.counter = 0
+        self.size = 0
+        self.lower_bound = 0
+
+    def get_lower_bound(self):
+        while self.open_heap[0][1] in self.removed:
+            heappop(self.open_heap)
+        return self.open_heap[0][0]
+
+    def push(self, node):
+        heappush(self.open_heap, (node.lower_bound, self.counter, node))
+        if node.cost > self.suboptimality * self.get_lower_bound():
+            heappush(self.pending_heap, (node.cost, self.counter, node))
+        else:
+            heappush(self.focal_heap, (node.num_conflicts, node.cost, self.counter, node))
+        self.counter += 1
+        self.size += 1
+
+    def pop(self):
+        self.lower_bound = self.get_lower_bound()
+        while self.pending_heap and self.pending_heap[0][0] <= self.suboptimality * self.lower_bound:
+            cost, counter, node = heappop(self.pending_heap)
+            heappush(self.focal_heap, (node.num_conflicts, cost, counter, node))
+        while self.focal_heap[0][1] > self.suboptimality * self.lower_bound:
+            _, cost, counter, node = heappop(self.focal_heap)
+            heappush(self.pending_heap, (cost, counter, node))
+        _, _, counter, node = heappop(self.focal_heap)
+        self.removed.add(counter)
+        self.size -= 1
+        return node
+
+    def __len__(self):
+        return self.size
+
+class ECBS(CBS):
+    """
+    CBS with focal search at both levels. The low level returns paths within
+    suboptimality of the optimal ones, with the fewest conflicts with the
+    other agents, and the high level expands the node with the fewest
+    conflicts among those within suboptimality of the lower bound.
+    Conflict prioritization relies on optimal paths and is not used.
+    """
+    node_class = ECBSNode
+
+    def __init__(self, environment, suboptimality, conflict_avoidance=True, bypass=False, disjoint_splitting=False):
+        CBS.__init__(self, environment, conflict_avoidance=conflict_avoidance, prioritize_conflicts=False,
+                     bypass=bypass, disjoint_splitting=disjoint_splitting, heuristic='none')
+        self.suboptimality = suboptimality
+        self.open_set = FocalList(suboptimality)
+        self.lower_bound = 0
+
+    def search(self, time_limit=None, node_limit=None):
+        plan = CBS.search(self, time_limit, node_limit)
+        if plan:
+            self.lower_bound = self.open_set.lower_bound
+        return plan
+
+    def create_root(self):
+        start = self.node_class()
+        self.env.constraint_dict = {}
+        if self.conflict_avoidance:
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable()
+        for agent in self.env.agent_dict:
+            result = self.env.compute_focal_agent_solution(agent, self.suboptimality, Constraints())
+            if not result:
+                return None
+            start.solution[agent], start.lower_bounds[agent] = result
+            if self.conflict_avoidance:
+                self.env.conflict_avoidance_table.add_path(start.solution[agent])
+        start.cost = self.env.compute_solution_cost(start.solution)
+        start.lower_bound = sum(start.lower_bounds.values())
+        start.conflicts = self.env.get_all_conflicts(start.solution)
+        start.num_conflicts = len(start.conflicts)
+        return start
+
+    def replan_agent(self, node, agent):
+        if self.conflict_avoidance:
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable.from_solution(node.solution, agent)
+        result = self.env.compute_focal_agent_solution(agent, self.suboptimality, node.get_constraints(agent))
+        if not result:
+            return False
+        path, lower_bound = result
+        # The node has more constraints than its parent, so the parent's bound still holds
+        lower_bound = max(lower_bound, node.lower_bounds[agent])
+        node.lower_bound += lower_bound - node.lower_bounds[agent]
+        node.lower_bounds[agent] = lower_bound
+        node.cost += len(path) - len(node.solution[agent])
+        node.solution[agent] = path
+        return True
+
+    def get_achieved_bound(self, solution):
+        """
+        Ratio of the solution cost to the lower bound on the optimal cost
+        """
+        return self.env.compute_solution_cost(solution) / self.lower_bound
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("-w", "--suboptimality", type=float, default=1.5,
+                        help="suboptimality factor, solutions cost at most w times the optimum")
+    parser.add_argument("--no-cat", action="store_true",
+                        help="do not count the conflicts with the other agents in the low level")
+    parser.add_argument("--bypass", action="store_true",
+                        help="adopt equal-cost child paths with fewer conflicts instead of branching")
+    parser.add_argument("--disjoint", action="store_true",
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    ecbs = ECBS(env, args.suboptimality, conflict_avoidance=not args.no_cat, bypass=args.bypass,
+                disjoint_splitting=args.disjoint)
+    solution = ecbs.search()
+    if not solution:
+        print(" Solution not found" )
+        return
+    print("solution cost within a factor {:.3f} of the optimum".format(ecbs.get_achieved_bound(solution)))
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = env.compute_solution_cost(solution)
+    output["lower_bound"] = ecbs.lower_bound
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+
+Admissible high-level heuristics of CBSH
+
+Each heuristic builds a graph over the agents whose edges are weighted by
+how much the costs of the two agents must increase together: 1 for
+cardinal conflicts (CG) or dependent agents (DG), the exact extra cost of
+planning the pair jointly (WDG). The smallest weighted vertex cover of that
+graph is a lower bound on the cost increase of the whole solution.
+
+See the articles: Adding Heuristics to Conflict-Based Search for Multi-Agent
+Path Finding (Felner et al.), ICAPS 2018
+Improved Heuristics for Multi-Agent Path Finding with Conflict-Based Search
+(Li et al.), IJCAI 2019
+
+"""
+
+HEURISTICS = ('none', 'cg', 'dg', 'wdg')
+
+def weighted_vertex_cover(weights):
+    """
+    Smallest sum of non-negative integer values on the vertices such that the
+    values at the ends of each edge add up to at least the edge weight.
+    weights maps pairs of vertices to weights.
+    """
+    neighbors = {}
+    for (u, v), weight in weights.items():
+        if weight > 0:
+            neighbors.setdefault(u, {})[v] = weight
+            neighbors.setdefault(v, {})[u] = weight
+
+    total = 0
+    visited = set()
+    for vertex in neighbors:
+        if vertex in visited:
+            continue
+        component = []
+        stack = [vertex]
+        visited.add(vertex)
+        while stack:
+            u = stack.pop()
+            component.append(u)
+            for v in neighbors[u]:
+                if v not in visited:
+                    visited.add(v)
+                    stack.append(v)
+        total += cover_component(component, neighbors)
+    return total
+
+def cover_component(component, neighbors):
+    """
+    Branch and bound over the values of the vertices of a connected component,
+    highest degree first
+    """
+    component = sorted(component, key=lambda u: -len(neighbors[u]))
+    values = {}
+    # Putting each edge weight on one of its ends is always a cover
+    best = [sum(weight for u in component for v, weight in neighbors[u].items() if u < v)]
+
+    def branch(index, total):
+        if total >= best[0]:
+            return
+        if index == len(component):
+            best[0] = total
+            return
+        u = component[index]
+        low = max([weight - values[v] for v, weight in neighbors[u].items() if v in values] + [0])
+        high = max(neighbors[u].values())
+        for value in range(low, max(low, high) + 1):
+            values[u] = value
+            branch(index + 1, total + value)
+        del values[u]
+
+    branch(0, 0)
+    return best[0]
@@ -0,0 +1,147 @@
+"""
+
+Independence detection (ID) front end of CBS
+
+Agents are first planned on their own. Groups of agents whose plans
+conflict are merged and solved together with CBS, until the plans of all
+the groups are conflict-free. Optimal plans of independent groups make an
+optimal plan of the whole instance, and CBS only ever sees the agents that
+actually interact.
+
+See the article: Finding Optimal Solutions to Cooperative Pathfinding
+Problems (Standley), AAAI 2010
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+
+from cbs.cbs import Location, State, Environment, CBS
+
+def solve_group(dimension, agents, obstacles, heuristic_cache, cbs_kwargs, time_limit):
+    """
+    Plan of a group of agents with CBS, {} if it has none within the time
+    limit
+    """
+    env = Environment(dimension, agents, obstacles, heuristic_cache)
+    return CBS(env, **cbs_kwargs).search(time_limit)
+
+def plan_to_path(path_dict_list):
+    return [State(step['t'], Location(step['x'], step['y'])) for step in path_dict_list]
+
+class IndependenceDetection(object):
+    """
+    Solves the groups of each round with CBS, in a process pool when there
+    is more than one worker. Each round merges disjoint pairs of conflicting
+    groups, in the order of their first conflict, so the new groups can be
+    solved concurrently. A group is merged at most once per round since its
+    new plan may no longer conflict with the other groups.
+    """
+    def __init__(self, environment, workers=1, **cbs_kwargs):
+        self.env = environment
+        self.workers = workers
+        self.cbs_kwargs = cbs_kwargs
+        self.groups = []
+
+    def search(self, time_limit=None):
+        """
+        Returns the plan in the format of CBS.generate_plan, {} if a group has
+        no solution within the time limit
+        """
+        deadline = None if time_limit is None else time.time() + time_limit
+        agents = {agent['name']: agent for agent in self.env.agents}
+        self.groups = [(name,) for name in agents]
+        plan = {}
+        unsolved = list(self.groups)
+
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            while unsolved:
+                tasks = []
+                for group in unsolved:
+                    args = (self.env.dimension, [agents[name] for name in group], self.env.obstacles,
+                            self.env.distance_table.cache_dir, self.cbs_kwargs,
+                            None if deadline is None else max(0, deadline - time.time()))
+                    tasks.append(pool.submit(solve_group, *args) if pool else args)
+                for task in tasks:
+                    group_plan = task.result() if pool else solve_group(*task)
+                    if not group_plan:
+                        return {}
+                    plan.update(group_plan)
+                unsolved = self.merge_conflicting_groups(plan)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        return plan
+
+    def merge_conflicting_groups(self, plan):
+        """
+        Merge pairs of groups whose plans conflict, returns the new groups
+        """
+        solution = {agent: plan_to_path(path) for agent, path in plan.items()}
+        group_of = {agent: group for group in self.groups for agent in group}
+        merged = {}
+        for conflict in self.env.iter_conflicts(solution):
+            group_1, group_2 = group_of[conflict.agent_1], group_of[conflict.agent_2]
+            if group_1 not in merged and group_2 not in merged:
+                merged[group_1] = merged[group_2] = group_1 + group_2
+
+        new_groups = []
+        for group in merged.values():
+            if group not in new_groups:
+                new_groups.append(group)
+        self.groups = [group for group in self.groups if group not in merged] + new_groups
+        return new_groups
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes solving the groups")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of the search, in seconds")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    id_search = IndependenceDetection(env, args.workers)
+    solution = id_search.search(args.time_limit)
+    if not solution:
+        print(" Solution not found" )
+        return
+    print("largest group of {} agents".format(max(len(group) for group in id_search.groups)))
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = sum(len(path) for path in solution.values())
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
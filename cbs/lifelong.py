@@ -0,0 +1,242 @@
+"""
+
+Rolling-horizon collision resolution (RHCR) for lifelong MAPF
+
+Agents receive a new goal each time they reach their current one. Every h
+timesteps, all the agents are replanned from their current cells to their
+current goals, resolving conflicts only within the first w timesteps
+(w >= h). The first h steps of the plan are committed and executed, then
+the goals are updated and the next window is planned. Each replan only
+deals with w timesteps, so its cost does not grow with the length of the
+run. When the solver fails, the agents are planned one by one around each
+other, and only those that find no path wait in place.
+
+See the article: Lifelong Multi-Agent Path Finding in Large-Scale
+Warehouses (Li et al.), AAAI 2021
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import random
+import yaml
+from collections import deque
+
+from cbs.cbs import Conflict, Environment, CBS
+from cbs.ecbs import ECBS
+from cbs.pbs import PBS, get_reservation
+
+class WindowedEnvironment(Environment):
+    """
+    Environment whose conflicts are only those up to timestep window: agents
+    are in distinct cells until then and do not swap before it
+    """
+    def __init__(self, dimension, agents, obstacles, window, heuristic_cache=None):
+        Environment.__init__(self, dimension, agents, obstacles, heuristic_cache)
+        self.window = window
+
+    def iter_conflicts(self, solution):
+        # Conflicts come ordered by time
+        for conflict in Environment.iter_conflicts(self, solution):
+            if conflict.time > self.window:
+                return
+            if self.in_window(conflict):
+                yield conflict
+
+    def get_agent_conflicts(self, agent, solution):
+        return [conflict for conflict in Environment.get_agent_conflicts(self, agent, solution)
+                if self.in_window(conflict)]
+
+    def in_window(self, conflict):
+        # An edge conflict at the window is a move beyond it
+        return conflict.time < self.window or (conflict.time == self.window and conflict.type == Conflict.VERTEX)
+
+class WindowedPBS(PBS):
+    """
+    PBS that only reserves the paths of higher-priority agents within the
+    window
+    """
+    def get_reservation(self, node, agents):
+        return get_reservation([node.solution[other] for other in agents], self.env.window)
+
+SOLVERS = {
+    'pbs': WindowedPBS,
+    'cbs': CBS,
+    'ecbs': lambda env: ECBS(env, 1.5)
+}
+
+class LifelongPlanner(object):
+    """
+    Runs the rolling horizon over a number of timesteps. Agents take their
+    goals from their 'goals' list, or 'goal', then from random free cells if
+    random_goals is set, otherwise they stay at their last goal.
+    """
+    def __init__(self, dimension, obstacles, agents, window=10, replan_period=5, solver='pbs',
+                 heuristic_cache=None, time_limit=None, random_goals=True, seed=None):
+        if replan_period > window:
+            raise ValueError("the replanning period must not exceed the window")
+        self.dimension = dimension
+        self.obstacles = obstacles
+        self.window = window
+        self.replan_period = replan_period
+        self.solver = SOLVERS[solver]
+        self.heuristic_cache = heuristic_cache
+        self.time_limit = time_limit
+        self.random_goals = random_goals
+        self.random = random.Random(seed)
+
+        self.names = [agent['name'] for agent in agents]
+        self.positions = {agent['name']: tuple(agent['start']) for agent in agents}
+        self.tasks = {agent['name']: deque(tuple(goal) for goal in agent.get('goals', [agent.get('goal')])
+                                           if goal is not None) for agent in agents}
+        self.free_cells = None
+        self.distance_table = None
+        self.finished = set()
+        self.paths = {name: [self.positions[name]] for name in self.names}
+        self.completed_goals = 0
+        self.failed_replans = 0
+
+    def run(self, steps):
+        """
+        Returns the executed schedule of steps timesteps, in the format of
+        CBS.generate_plan
+        """
+        time = 0
+        while time < steps:
+            self.update_goals()
+            env = WindowedEnvironment(self.dimension, self.get_agents(), self.obstacles, self.window,
+                                      self.heuristic_cache)
+            plan = self.replan(env)
+            if not plan:
+                self.failed_replans += 1
+                plan = self.replan_prioritized(env)
+            for t in range(1, min(self.replan_period, steps - time) + 1):
+                for name in self.names:
+                    self.positions[name] = plan[name][min(t, len(plan[name])-1)]
+                    self.paths[name].append(self.positions[name])
+                self.update_goals()
+            time += self.replan_period
+        return {name: [{'t':t, 'x':x, 'y':y} for t, (x, y) in enumerate(path)] for name, path in self.paths.items()}
+
+    def update_goals(self):
+        for name in self.names:
+            tasks = self.tasks[name]
+            if tasks and tasks[0] == self.positions[name] and name not in self.finished:
+                tasks.popleft()
+                self.completed_goals += 1
+            if not tasks:
+                if self.random_goals:
+                    tasks.append(self.get_random_goal(self.positions[name]))
+                else:
+                    # The agent stays at its last goal
+                    tasks.append(self.positions[name])
+                    self.finished.add(name)
+
+    def get_random_goal(self, position):
+        """
+        Random free cell reachable from position, position itself if there
+        is none
+        """
+        if self.free_cells is None:
+            env = Environment(self.dimension, [], self.obstacles, self.heuristic_cache)
+            self.free_cells = sorted(env.grid.neighbours)
+            self.distance_table = env.distance_table
+        # Distances are symmetric, so the table of position gives the cells it reaches
+        table = self.distance_table.get_table(position)
+        goals = [cell for cell in self.free_cells if cell != position and table[cell] != float('inf')]
+        if not goals:
+            return position
+        return self.random.choice(goals)
+
+    def get_agents(self):
+        return [{'name': name, 'start': list(self.positions[name]), 'goal': list(self.tasks[name][0])}
+                for name in self.names]
+
+    def replan(self, env):
+        """
+        Windowed plan of every agent from its cell to its current goal, as
+        lists of cells, {} if the solver failed
+        """
+        plan = self.solver(env).search(self.time_limit)
+        return {name: [(step['x'], step['y']) for step in path] for name, path in plan.items()}
+
+    def replan_prioritized(self, env):
+        """
+        Windowed prioritized planning of the agents in order, around the
+        paths of the agents before them. An agent without a path waits in
+        place, and the agents are planned again with the waiting ones
+        reserved first, so the others keep moving.
+        """
+        waiting = []
+        while True:
+            paths = {name: [env.agent_dict[name]['start']] for name in waiting}
+            reservation = get_reservation(paths.values(), self.window)
+            for name in self.names:
+                if name in paths:
+                    continue
+                path = env.compute_agent_solution(name, reservation)
+                if not path:
+                    waiting.append(name)
+                    break
+                paths[name] = path
+                reservation.add_constraint(get_reservation([path], self.window))
+            else:
+                return {name: [(state.location.x, state.location.y) for state in path]
+                        for name, path in paths.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("-w", "--window", type=int, default=10,
+                        help="number of timesteps in which conflicts are resolved")
+    parser.add_argument("--replan-period", type=int, default=5,
+                        help="number of timesteps executed between two replans, at most the window")
+    parser.add_argument("--steps", type=int, default=100,
+                        help="number of timesteps of the run")
+    parser.add_argument("--solver", choices=sorted(SOLVERS), default='pbs',
+                        help="windowed solver of each replan")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of each replan, in seconds")
+    parser.add_argument("--no-random-goals", action="store_true",
+                        help="keep agents at their last goal instead of drawing new ones")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random goals")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    # Planning
+    planner = LifelongPlanner(dimension, obstacles, agents, args.window, args.replan_period, args.solver,
+                              args.heuristic_cache, args.time_limit, not args.no_random_goals, args.seed)
+    solution = planner.run(args.steps)
+    print("{} goals reached in {} timesteps, {} failed replans".format(
+        planner.completed_goals, args.steps, planner.failed_replans))
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["completed_goals"] = planner.completed_goals
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
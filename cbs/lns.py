@@ -0,0 +1,258 @@
+"""
+
+MAPF-LNS: anytime improvement of a MAPF solution by Large Neighborhood Search
+
+Each iteration removes the paths of a small neighborhood of agents and
+replans them one at a time, in a random order, around all the other paths.
+The new paths are kept when they lower the sum of costs. A reservation
+table of the whole solution is kept between iterations, and only the paths
+of the neighborhood are taken out of it and put back. Neighborhoods are
+drawn by one of three heuristics, chosen at random with weights that follow
+the improvement each one brought per second:
+- random: agents drawn uniformly
+- agent: the most delayed agent, with the agents found on its shortest paths
+- map: agents going through an intersection and the cells around it
+
+See the article: Anytime Multi-Agent Path Finding via Large Neighborhood
+Search (Li et al.), IJCAI 2021
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import random
+import time
+import yaml
+from collections import deque
+
+from cbs.cbs import Constraints, Environment, CBS, SearchBudget
+from cbs.ecbs import ECBS
+from cbs.pbs import PBS, get_reservation
+from cbs.pibt import PIBT
+from cbs.independence import plan_to_path
+
+NEIGHBORHOODS = ('random', 'agent', 'map')
+
+class MAPFLNS(object):
+    def __init__(self, environment, neighborhood_size=8, reaction=0.1, seed=None):
+        self.env = environment
+        self.neighborhood_size = neighborhood_size
+        # Weight given to the last observation when updating the selection weights
+        self.reaction = reaction
+        self.random = random.Random(seed)
+        self.weights = {name: 1.0 for name in NEIGHBORHOODS}
+        self.tabu = set()
+        self.intersections = [cell for cell, neighbours in self.env.grid.neighbours.items() if len(neighbours) > 2]
+        self.cost_history = []
+        # Reservation table of the paths of the solution, and of each path
+        self.reservation = None
+        self.path_reservations = {}
+
+    def search(self, plan, time_limit=None, iteration_limit=None):
+        """
+        Improve a plan in the format of CBS.generate_plan until the time (in
+        seconds) or iteration budget runs out, returns the best plan
+        """
+        budget = self.budget = SearchBudget(time_limit, iteration_limit)
+        solution = {agent: plan_to_path(path) for agent, path in plan.items()}
+        cost = self.env.compute_solution_cost(solution)
+        self.cost_history = [(0, cost)]
+        start_time = time.time()
+        self.reservation = Constraints()
+        self.path_reservations = {}
+        for agent, path in solution.items():
+            self.reserve(agent, path)
+
+        while not budget.exhausted():
+            budget.expanded += 1
+            name = self.select_neighborhood()
+            iteration_start = time.time()
+            neighborhood = getattr(self, 'get_' + name + '_neighborhood')(solution)
+            gain = 0
+            if neighborhood:
+                paths = self.replan(solution, neighborhood)
+                if paths:
+                    gain = sum(len(solution[agent]) - len(path) for agent, path in paths.items())
+                # Put back the paths of the neighborhood that are kept
+                for agent in neighborhood:
+                    self.release(agent)
+                if gain > 0:
+                    solution.update(paths)
+                    cost -= gain
+                    self.cost_history.append((time.time() - start_time, cost))
+                for agent in neighborhood:
+                    self.reserve(agent, solution[agent])
+            rate = max(gain, 0) / max(time.time() - iteration_start, 1e-6)
+            self.weights[name] = self.reaction * rate + (1 - self.reaction) * self.weights[name]
+        return self.generate_plan(solution)
+
+    def select_neighborhood(self):
+        # Roulette wheel over the weights, with a floor so no heuristic starves
+        weights = [max(self.weights[name], 1e-3) for name in NEIGHBORHOODS]
+        return self.random.choices(NEIGHBORHOODS, weights)[0]
+
+    def replan(self, solution, neighborhood):
+        """
+        Prioritized planning of the neighborhood, in a random order, around
+        the other paths. Returns the new paths, None if an agent is stuck or
+        the time runs out. The reservation then holds the new paths instead
+        of those of the neighborhood.
+        """
+        agents = list(neighborhood)
+        self.random.shuffle(agents)
+        for agent in agents:
+            self.release(agent)
+        self.env.conflict_avoidance_table = None
+        paths = {}
+        for agent in agents:
+            if self.budget.out_of_time():
+                return None
+            path = self.env.compute_agent_solution(agent, self.reservation)
+            if not path:
+                return None
+            paths[agent] = path
+            self.reserve(agent, path)
+        return paths
+
+    def reserve(self, agent, path):
+        self.path_reservations[agent] = get_reservation([path])
+        self.reservation.add_constraint(self.path_reservations[agent])
+
+    def release(self, agent):
+        """
+        Take the path of the agent out of the reservation, if it is in it
+        """
+        path_reservation = self.path_reservations.pop(agent, None)
+        if path_reservation is not None:
+            self.reservation.remove_constraint(path_reservation)
+
+    def get_random_neighborhood(self, solution):
+        agents = list(solution)
+        return set(self.random.sample(agents, min(self.neighborhood_size, len(agents))))
+
+    def get_agent_neighborhood(self, solution):
+        """
+        The most delayed agent outside the tabu list, with agents whose paths
+        cross its shortest paths
+        """
+        delays = {agent: len(path) - 1 - self.env.admissible_heuristic(self.env.agent_dict[agent]['start'], agent)
+                  for agent, path in solution.items() if agent not in self.tabu}
+        if not delays or max(delays.values()) == 0:
+            self.tabu = set()
+            return None
+        agent = max(delays, key=lambda other: delays[other])
+        self.tabu.add(agent)
+
+        start = self.env.agent_dict[agent]['start'].location
+        goal_table = self.env.heuristic_tables[agent]
+        start_table = self.env.distance_table.get_table((start.x, start.y))
+        shortest = goal_table[start.x, start.y]
+        blocking = set()
+        for other, path in solution.items():
+            if other != agent and any(start_table[state.location.x, state.location.y] +
+                                      goal_table[state.location.x, state.location.y] == shortest for state in path):
+                blocking.add(other)
+        blocking = self.random.sample(sorted(blocking), min(self.neighborhood_size - 1, len(blocking)))
+        return set(blocking) | {agent}
+
+    def get_map_neighborhood(self, solution):
+        """
+        Agents visiting a random intersection, then the cells around it in
+        breadth-first order
+        """
+        if not self.intersections:
+            return None
+        visitors = {}
+        for agent, path in solution.items():
+            for state in path:
+                visitors.setdefault((state.location.x, state.location.y), set()).add(agent)
+
+        cell = self.random.choice(self.intersections)
+        neighborhood = set()
+        visited = {cell}
+        queue = deque([cell])
+        while queue and len(neighborhood) < self.neighborhood_size:
+            cell = queue.popleft()
+            agents = sorted(visitors.get(cell, set()) - neighborhood)
+            self.random.shuffle(agents)
+            neighborhood.update(agents[:self.neighborhood_size - len(neighborhood)])
+            for neighbour in self.env.grid.get_neighbours(cell):
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    queue.append(neighbour)
+        return neighborhood
+
+    generate_plan = CBS.generate_plan
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--init", choices=('pbs', 'pibt', 'ecbs', 'cbs'), default='pbs',
+                        help="solver of the initial solution")
+    parser.add_argument("--schedule", default=None,
+                        help="file with an initial schedule to improve instead, e.g. from multi_sipp.py")
+    parser.add_argument("--time-limit", type=float, default=10,
+                        help="wall-clock budget of the improvement, in seconds")
+    parser.add_argument("--neighborhood-size", type=int, default=8,
+                        help="number of agents replanned at each iteration")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random neighborhoods")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Initial solution
+    if args.schedule is not None:
+        with open(args.schedule, 'r') as schedule_file:
+            try:
+                plan = yaml.load(schedule_file, Loader=yaml.FullLoader)["schedule"]
+            except yaml.YAMLError as exc:
+                print(exc)
+    elif args.init == 'pbs':
+        plan = PBS(env).search()
+    elif args.init == 'pibt':
+        plan = PIBT(env, args.seed).search()
+    elif args.init == 'ecbs':
+        plan = ECBS(env, 1.5).search()
+    else:
+        plan = CBS(env).search()
+    if not plan:
+        print(" Solution not found" )
+        return
+
+    # Searching
+    lns = MAPFLNS(env, args.neighborhood_size, seed=args.seed)
+    solution = lns.search(plan, args.time_limit)
+    print("sum of costs improved from {} to {} in {} iterations".format(
+        lns.cost_history[0][1], lns.cost_history[-1][1], lns.budget.expanded))
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = lns.cost_history[-1][1]
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
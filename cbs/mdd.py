@@ -0,0 +1,83 @@
+"""
+
+Multi-valued decision diagram (MDD) of the shortest paths of an agent
+
+See the article: ICBS: Improved Conflict-Based Search Algorithm for
+Multi-Agent Pathfinding (Boyarski et al.), IJCAI 2015
+
+"""
+
+class MDD(object):
+    """
+    Locations an agent may occupy at each timestep on some path of the given
+    cost that satisfies its constraints. Level t of a path of cost c only
+    exists for t < c; afterwards the agent stays at its goal.
+    """
+    def __init__(self, env, agent_name, constraints, cost):
+        self.agent_name = agent_name
+        self.depth = cost - 1
+        self.goal = env.agent_dict[agent_name]["goal"].location
+        self.levels = []
+        self.children = []
+        self.build(env, constraints)
+
+    def build(self, env, constraints):
+        env.constraints = constraints
+        start = env.agent_dict[self.agent_name]["start"]
+
+        # Forward pass over the states that can still reach the goal in time
+        layer = {start.location: start}
+        edges = []
+        for t in range(self.depth):
+            next_layer = {}
+            level_edges = []
+            for location, state in layer.items():
+                for neighbor in env.get_neighbors(state):
+                    if t + 1 + env.admissible_heuristic(neighbor, self.agent_name) > self.depth:
+                        continue
+                    next_layer.setdefault(neighbor.location, neighbor)
+                    level_edges.append((location, neighbor.location))
+            layer = next_layer
+            edges.append(level_edges)
+
+        # Backward pass keeps the states that do reach the goal
+        self.levels = [set() for _ in range(self.depth + 1)]
+        if self.goal in layer:
+            self.levels[-1].add(self.goal)
+        self.children = [{} for _ in range(self.depth)]
+        for t in range(self.depth - 1, -1, -1):
+            for u, v in edges[t]:
+                if v in self.levels[t+1]:
+                    self.children[t].setdefault(u, set()).add(v)
+            self.levels[t] = set(self.children[t])
+
+    def get_level(self, t):
+        if t >= self.depth:
+            return {self.goal}
+        return self.levels[t]
+
+    def get_children(self, t, location):
+        if t >= self.depth:
+            return {self.goal}
+        return self.children[t].get(location, ())
+
+    def is_singleton(self, t, location):
+        level = self.get_level(t)
+        return len(level) == 1 and location in level
+
+def are_dependent(mdd_1, mdd_2):
+    """
+    Two agents are dependent if every pair of paths from their MDDs conflicts,
+    which is checked on the product of the two MDDs
+    """
+    layer = {(location_1, location_2) for location_1 in mdd_1.get_level(0) for location_2 in mdd_2.get_level(0)
+             if location_1 != location_2}
+    for t in range(max(mdd_1.depth, mdd_2.depth)):
+        next_layer = set()
+        for location_1, location_2 in layer:
+            for next_1 in mdd_1.get_children(t, location_1):
+                for next_2 in mdd_2.get_children(t, location_2):
+                    if next_1 != next_2 and not (next_1 == location_2 and next_2 == location_1):
+                        next_layer.add((next_1, next_2))
+        layer = next_layer
+    return not layer
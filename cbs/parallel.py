@@ -0,0 +1,256 @@
+"""
+
+CBS expanding several nodes of the open list at once on a process pool
+
+Each round pops up to one node per worker from the open list, and each
+worker expands a whole node: conflict selection with its MDDs, the replans
+of the children, their conflicts and their high-level heuristic. Only the
+bookkeeping of the open list stays in the main process. Each worker builds
+its own environment and CBS once, from the map, the agents and the distance
+tables of their goals. A node is then shipped as its paths, as tuples of
+cells, its conflicts and the constraints of each agent, and the children
+come back as the paths they changed.
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import os
+import time
+import yaml
+from concurrent.futures import ProcessPoolExecutor
+
+from cbs.cbs import Location, State, Environment, CBS, HighLevelNode, SearchBudget
+from distance_table import DistanceTable
+from occupancy_grid import OccupancyGrid
+
+# CBS of the worker process, and the paths it decoded. Paths are never
+# modified once planned, so nodes share them in both processes.
+worker_cbs = None
+worker_paths = {}
+
+def init_worker(dimension, agents, obstacles, tables, cbs_kwargs):
+    global worker_cbs
+    DistanceTable.for_grid(OccupancyGrid.for_map(dimension, obstacles)).tables.update(tables)
+    worker_cbs = CBS(Environment(dimension, agents, obstacles), **cbs_kwargs)
+    worker_cbs.node_class = ShippedNode
+
+def encode_path(path):
+    return tuple((state.location.x, state.location.y) for state in path)
+
+def decode_path(cells):
+    return [State(t, Location(x, y)) for t, (x, y) in enumerate(cells)]
+
+def get_constraint_lists(node):
+    """
+    Constraints added for each agent along the path to the root, unmerged,
+    in a single walk of the tree
+    """
+    constraint_lists = {agent: [] for agent in node.solution}
+    while node.parent is not None:
+        constraint_lists[node.agent].append(node.constraint)
+        if node.constraint.has_positive_constraints():
+            implied = node.constraint.get_implied_constraints()
+            for agent, constraint_list in constraint_lists.items():
+                if agent != node.agent:
+                    constraint_list.append(implied)
+        node = node.parent
+    return constraint_lists
+
+def expand_task(solution, conflicts, cost, constraint_lists, time_limit):
+    """
+    Expand a node in the worker. Returns the children as (agent, constraint,
+    changed paths, conflicts, cost, heuristic), or the node itself after a
+    bypass as (None, None, changed paths, conflicts, cost, 0).
+    """
+    P = ShippedNode()
+    P.solution = {}
+    for agent, cells in solution.items():
+        if cells not in worker_paths:
+            worker_paths[cells] = decode_path(cells)
+        P.solution[agent] = worker_paths[cells]
+    P.conflicts = conflicts
+    P.num_conflicts = len(conflicts)
+    P.cost = cost
+    P.constraint_lists = constraint_lists
+    worker_cbs.budget = SearchBudget(time_limit)
+    parent_solution = dict(P.solution)
+
+    results = []
+    for node in worker_cbs.expand(P):
+        changed = {agent: encode_path(path) for agent, path in node.solution.items()
+                   if path is not parent_solution[agent]}
+        if node is P:
+            results.append((None, None, changed, node.conflicts, node.cost, 0))
+        else:
+            results.append((node.agent, node.constraint, changed, node.conflicts, node.cost, node.h))
+    return results
+
+class ShippedNode(HighLevelNode):
+    """
+    Node rebuilt in a worker, without its ancestors: the root of the worker's
+    tree keeps the constraints of each agent along the path to the real root
+    """
+    def __init__(self, parent=None, agent=None, constraint=None):
+        HighLevelNode.__init__(self, parent, agent, constraint)
+        self.constraint_lists = {}
+
+    def get_constraint_list(self, agent):
+        if self.parent is None:
+            return list(self.constraint_lists.get(agent, []))
+        constraint_list = self.parent.get_constraint_list(agent)
+        if self.agent == agent:
+            constraint_list.append(self.constraint)
+        elif self.constraint.has_positive_constraints():
+            constraint_list.append(self.constraint.get_implied_constraints())
+        return constraint_list
+
+    @property
+    def constraint_dict(self):
+        return {agent: self.get_constraints(agent) for agent in self.solution}
+
+class ParallelCBS(CBS):
+    """
+    CBS whose rounds pop up to one node per worker and expand them all in
+    parallel. The first node of a round is the one CBS would expand, so a
+    conflict-free node is only returned when it comes first, which keeps the
+    solution optimal; the other nodes of a round are expanded early, so the
+    search can expand more nodes than CBS. MA-CBS merges count conflicts
+    over the whole tree and are not supported.
+    """
+    def __init__(self, environment, workers=None, **kwargs):
+        if kwargs.get('merge_threshold') is not None:
+            raise ValueError("ParallelCBS does not merge agents")
+        CBS.__init__(self, environment, **kwargs)
+        self.workers = workers or os.cpu_count()
+        self.cbs_kwargs = kwargs
+        self.pool = None
+        # Cells of the paths of the tree, by path
+        self.encoded_paths = {}
+
+    def search(self, time_limit=None, node_limit=None):
+        env = self.env
+        budget = self.budget = SearchBudget(time_limit, node_limit)
+        # Workers start with the distance tables of every goal
+        tables = {(info['goal'].location.x, info['goal'].location.y): env.heuristic_tables[agent]
+                  for agent, info in env.agent_dict.items()}
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                        initargs=(env.dimension, env.agents, env.obstacles,
+                                                  tables, self.cbs_kwargs))
+        try:
+            start = self.create_root()
+            if start is None:
+                return {}
+            self.open_set.push(start)
+
+            while self.open_set:
+                if budget.exhausted():
+                    return {}
+                batch = []
+                while self.open_set and len(batch) < self.workers and \
+                        (node_limit is None or budget.expanded + len(batch) < node_limit):
+                    P = self.open_set.pop()
+                    if not P.conflicts:
+                        if not batch:
+                            print("solution found")
+
+                            return self.generate_plan(P.solution)
+                        # Nodes of the round may still have cheaper children
+                        self.open_set.push(P)
+                        break
+                    batch.append(P)
+
+                budget.expanded += len(batch)
+                remaining = None if budget.deadline is None else max(0, budget.deadline - time.time())
+                futures = [self.pool.submit(expand_task,
+                                            {agent: self.encode_path(path) for agent, path in P.solution.items()},
+                                            P.conflicts, P.cost, get_constraint_lists(P), remaining)
+                           for P in batch]
+                for P, future in zip(batch, futures):
+                    for new_node in self.receive_children(P, future.result()):
+                        self.open_set.push(new_node)
+            return {}
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def encode_path(self, path):
+        # The path is kept with its cells, so its id is not reused
+        if id(path) not in self.encoded_paths:
+            self.encoded_paths[id(path)] = (path, encode_path(path))
+        return self.encoded_paths[id(path)][1]
+
+    def receive_children(self, P, results):
+        """
+        Nodes to push from the results of the expansion of P
+        """
+        nodes = []
+        for agent, constraint, changed, conflicts, cost, h in results:
+            node = P if agent is None else self.node_class(P, agent, constraint)
+            if agent is None:
+                # Bypass: P keeps the better solution instead of branching
+                node.solution = dict(P.solution)
+            for other, cells in changed.items():
+                path = decode_path(cells)
+                self.encoded_paths[id(path)] = (path, cells)
+                node.solution[other] = path
+            node.conflicts = conflicts
+            node.num_conflicts = len(conflicts)
+            node.cost = cost
+            if agent is not None:
+                node.h = h
+            nodes.append(node)
+        return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes, the number of CPUs by default")
+    parser.add_argument("--no-cat", action="store_true",
+                        help="do not count the conflicts with the other agents in the low level")
+    parser.add_argument("--disjoint", action="store_true",
+                        help="split conflicts with a positive and a negative constraint on one agent")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of the search, in seconds")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    cbs = ParallelCBS(env, args.workers, conflict_avoidance=not args.no_cat, disjoint_splitting=args.disjoint)
+    solution = cbs.search(args.time_limit)
+    if not solution:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = env.compute_solution_cost(solution)
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
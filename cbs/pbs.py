@@ -0,0 +1,214 @@
+"""
+
+Priority-Based Search (PBS)
+
+Instead of constraints, the high level branches on which of two conflicting
+agents has priority over the other. Each node keeps a partial order of the
+agents, and every agent is planned with the A* of CBS around the paths of
+the agents above it, used as a reservation table. Adding a priority only
+replans the lower agent and, in topological order, the agents below it
+whose paths no longer avoid those above them. The priority tree is explored
+depth-first, cheaper child first.
+
+See the article: Searching with Consistent Prioritization for Multi-Agent
+Path Finding (Ma et al.), AAAI 2019
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import yaml
+
+from cbs.cbs import State, VertexConstraint, EdgeConstraint, Constraints, ConflictAvoidanceTable, Environment, CBS, \
+    SearchBudget
+
+def get_reservation(paths, window=None):
+    """
+    Reservation table of paths, as constraints on another agent, only up to
+    timestep window if a window is given
+    """
+    reservation = Constraints()
+    for path in paths:
+        if window is not None:
+            # Paths are padded with their goal up to the window, which is not reserved beyond it
+            path = [path[min(t, len(path)-1)] for t in range(window + 1)]
+            path = [State(t, state.location) for t, state in enumerate(path)]
+        for state_1, state_2 in zip(path, path[1:]):
+            reservation.add_vertex_constraint(VertexConstraint(state_1.time, state_1.location))
+            if state_1.location != state_2.location:
+                reservation.add_edge_constraint(EdgeConstraint(state_1.time, state_2.location, state_1.location))
+        if window is None:
+            # The other agent stays at its goal once its path ends
+            reservation.add_target_constraint(VertexConstraint(path[-1].time, path[-1].location))
+        else:
+            reservation.add_vertex_constraint(VertexConstraint(window, path[-1].location))
+    return reservation
+
+class PBSNode(object):
+    """
+    Node of the priority tree. higher maps each agent to the set of agents
+    with priority over it, closed transitively.
+    """
+    def __init__(self, parent=None):
+        self.solution = {} if parent is None else dict(parent.solution)
+        self.higher = {} if parent is None else dict(parent.higher)
+        self.cost = 0 if parent is None else parent.cost
+
+    def add_priority(self, high, low):
+        raised = self.higher[high] | {high}
+        for agent, higher in self.higher.items():
+            if agent == low or low in higher:
+                self.higher[agent] = higher | raised
+
+    def get_lower(self, agent):
+        """
+        Agents below the agent, in topological order
+        """
+        lower = [other for other, higher in self.higher.items() if agent in higher]
+        # An agent has strictly more agents above it than any agent above it
+        return sorted(lower, key=lambda other: len(self.higher[other]))
+
+class PBS(object):
+    def __init__(self, environment, conflict_avoidance=True):
+        self.env = environment
+        self.conflict_avoidance = conflict_avoidance
+
+    def search(self, time_limit=None, node_limit=None):
+        """
+        Returns the plan, or {} if none was found within the time (in
+        seconds) or expanded node budget. PBS is incomplete, a failure does
+        not mean that there is no solution.
+        """
+        budget = self.budget = SearchBudget(time_limit, node_limit)
+        start = self.create_root()
+        if start is None:
+            return {}
+        stack = [start]
+
+        while stack:
+            if budget.exhausted():
+                return {}
+            P = stack.pop()
+
+            conflict = self.env.get_first_conflict(P.solution)
+            if not conflict:
+                print("solution found")
+
+                return self.generate_plan(P.solution)
+
+            budget.expanded += 1
+            children = []
+            for high, low in ((conflict.agent_1, conflict.agent_2), (conflict.agent_2, conflict.agent_1)):
+                new_node = self.generate_child(P, high, low)
+                if new_node is not None:
+                    children.append(new_node)
+            children.sort(key=lambda node: node.cost, reverse=True)
+            stack.extend(children)
+
+        return {}
+
+    def create_root(self):
+        """
+        Root of the priority tree, every agent on its own
+        """
+        start = PBSNode()
+        self.env.constraint_dict = {}
+        self.env.conflict_avoidance_table = ConflictAvoidanceTable() if self.conflict_avoidance else None
+        start.solution = self.env.compute_solution()
+        if not start.solution:
+            return None
+        start.higher = {agent: frozenset() for agent in start.solution}
+        start.cost = self.env.compute_solution_cost(start.solution)
+        return start
+
+    def generate_child(self, P, high, low):
+        """
+        Child of P in which high has priority over low, None if that breaks
+        the partial order or if an agent can no longer reach its goal
+        """
+        if low in P.higher[high] or high in P.higher[low]:
+            return None
+        new_node = PBSNode(P)
+        new_node.add_priority(high, low)
+
+        replanned = []
+        for agent in [low] + new_node.get_lower(low):
+            if agent != low:
+                # The path already avoids the agents that were above it and kept their paths
+                changed = set(replanned) | (new_node.higher[agent] - P.higher[agent])
+                if self.env.path_satisfies(new_node.solution[agent], self.get_reservation(new_node, changed)):
+                    continue
+            if not self.replan_agent(new_node, agent, self.get_reservation(new_node, new_node.higher[agent])):
+                return None
+            replanned.append(agent)
+        return new_node
+
+    def get_reservation(self, node, agents):
+        """
+        Constraints keeping an agent off the paths of the given agents
+        """
+        return get_reservation([node.solution[other] for other in agents])
+
+    def replan_agent(self, node, agent, reservation):
+        if self.conflict_avoidance:
+            # Conflicts with the agents that do not have priority are avoided when it is free
+            self.env.conflict_avoidance_table = ConflictAvoidanceTable.from_solution(
+                {other: path for other, path in node.solution.items()
+                 if other != agent and other not in node.higher[agent]})
+        path = self.env.compute_agent_solution(agent, reservation)
+        if not path:
+            return False
+        node.cost += len(path) - len(node.solution[agent])
+        node.solution[agent] = path
+        return True
+
+    generate_plan = CBS.generate_plan
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of the search, in seconds")
+    parser.add_argument("--no-cat", action="store_true",
+                        help="do not count the conflicts with the other agents in the low level")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    pbs = PBS(env, conflict_avoidance=not args.no_cat)
+    solution = pbs.search(args.time_limit)
+    if not solution:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = env.compute_solution_cost(solution)
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+
+Priority Inheritance with Backtracking (PIBT)
+
+A rule-based solver that plans one synchronized step of all the agents at a
+time. Agents choose their next cell by decreasing priority, closest to their
+goal first according to the distance tables. An agent that wants the cell
+of another agent which has not moved yet lends it its priority, so that the
+other agent moves out of the way first; if the other agent cannot move, the
+first one backtracks to its next choice. Priorities grow with the time since
+an agent last reached its goal. Two agents facing each other in a corridor
+swap by the agent in front backing out of it first.
+
+PIBT alone can cycle through the same configurations forever. Steps are
+therefore searched depth-first over configurations (LaCAM): when a step
+leads back to a known configuration, the step is generated again with the
+cells of more and more agents fixed, which makes the solver complete.
+Solutions are far from optimal but are found for thousands of agents, and
+can seed slower optimizing solvers such as MAPF-LNS.
+
+See the articles: Priority Inheritance with Backtracking for Iterative
+Multi-agent Path Finding (Okumura et al.), IJCAI 2019
+LaCAM: Search-Based Algorithm for Quick Multi-Agent Pathfinding (Okumura),
+AAAI 2023
+Engineering LaCAM*: Towards Real-Time, Large-Scale, and Near-Optimal
+Multi-Agent Pathfinding (Okumura), AAMAS 2024
+
+"""
+import sys
+sys.path.insert(0, '../')
+import argparse
+import random
+import yaml
+from collections import deque
+
+from cbs.cbs import Environment, SearchBudget
+
+class StepConstraint(object):
+    """
+    Node of the constraint tree of a configuration: the cells of the first
+    agents in the order are fixed for the next step
+    """
+    def __init__(self, parent=None, agent=None, cell=None):
+        self.parent = parent
+        self.agent = agent
+        self.cell = cell
+        self.depth = 0 if parent is None else parent.depth + 1
+
+    def get_cells(self):
+        cells = []
+        constraint = self
+        while constraint.parent is not None:
+            cells.append((constraint.agent, constraint.cell))
+            constraint = constraint.parent
+        return cells
+
+class ConfigurationNode(object):
+    """
+    Cells of all the agents at one step, with the priorities of the agents
+    and the constraints of the next steps left to try
+    """
+    def __init__(self, configuration, priorities, parent=None):
+        self.configuration = configuration
+        self.priorities = priorities
+        self.parent = parent
+        # Priorities are distinct, so the order does not depend on the agents' order
+        self.order = sorted(priorities, key=priorities.get, reverse=True)
+        self.constraints = deque([StepConstraint()])
+
+class PIBT(object):
+    def __init__(self, environment, seed=None):
+        self.env = environment
+        self.random = random.Random(seed)
+        self.agents = list(self.env.agent_dict)
+        self.starts = {agent: (info['start'].location.x, info['start'].location.y)
+                       for agent, info in self.env.agent_dict.items()}
+        self.goals = {agent: (info['goal'].location.x, info['goal'].location.y)
+                      for agent, info in self.env.agent_dict.items()}
+        # Priority inheritance recurses along chains of agents pushing each other
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 2 * len(self.agents) + 100))
+
+    def search(self, time_limit=None, node_limit=None):
+        """
+        Returns the plan in the format of CBS.generate_plan, {} if there is
+        none or if the time (in seconds) or configuration budget runs out
+        """
+        budget = self.budget = SearchBudget(time_limit, node_limit)
+        # Distinct fractional parts break ties between priorities
+        order = list(self.agents)
+        self.random.shuffle(order)
+        priorities = {agent: i / len(order) for i, agent in enumerate(order)}
+        goal_key = self.get_key(self.goals)
+
+        start = ConfigurationNode(dict(self.starts), priorities)
+        explored = {self.get_key(start.configuration): start}
+        stack = [start]
+        while stack:
+            node = stack[-1]
+            if self.get_key(node.configuration) == goal_key:
+                return self.generate_plan(node)
+            if not node.constraints:
+                stack.pop()
+                continue
+            if budget.exhausted():
+                return {}
+            budget.expanded += 1
+
+            constraint = node.constraints.popleft()
+            if constraint.depth < len(self.agents):
+                # Later steps from this configuration also fix the next agent in the order
+                agent = node.order[constraint.depth]
+                cells = list(self.env.grid.get_neighbours(node.configuration[agent])) + [node.configuration[agent]]
+                self.random.shuffle(cells)
+                for cell in cells:
+                    node.constraints.append(StepConstraint(constraint, agent, cell))
+
+            configuration = self.step(node, constraint)
+            if configuration is None:
+                continue
+            key = self.get_key(configuration)
+            if key in explored:
+                # Go on from the known configuration rather than deeper in a detour
+                stack.append(explored[key])
+                continue
+            new_node = ConfigurationNode(configuration, self.update_priorities(node, configuration), node)
+            explored[key] = new_node
+            stack.append(new_node)
+
+        return {}
+
+    def get_key(self, configuration):
+        return tuple(configuration[agent] for agent in self.agents)
+
+    def update_priorities(self, node, configuration):
+        priorities = {}
+        for agent, priority in node.priorities.items():
+            if configuration[agent] == self.goals[agent]:
+                priorities[agent] = priority - int(priority)
+            else:
+                priorities[agent] = priority + 1
+        return priorities
+
+    def step(self, node, constraint):
+        """
+        Next cell of every agent, with PIBT for the agents the constraint
+        does not fix, None if there is no such step
+        """
+        self.current = node.configuration
+        self.next = {}
+        self.occupied_now = {cell: agent for agent, cell in self.current.items()}
+        self.occupied_next = {}
+        for agent, cell in constraint.get_cells():
+            other = self.occupied_now.get(cell)
+            if cell in self.occupied_next or (other is not None and self.next.get(other) == self.current[agent]):
+                return None
+            self.occupied_next[cell] = agent
+            self.next[agent] = cell
+        for agent in node.order:
+            if agent not in self.next and not self.pibt(agent):
+                return None
+
+        # An agent that had to stay may be in a cell a fixed agent moves into
+        if len(set(self.next.values())) < len(self.agents):
+            return None
+        for agent, cell in self.next.items():
+            other = self.occupied_now.get(cell)
+            if other is not None and other != agent and self.next[other] == self.current[agent]:
+                return None
+        return self.next
+
+    def pibt(self, agent):
+        """
+        Move the agent, making the agents in its way move first. Returns
+        False if the agent has to stay where it is.
+        """
+        position = self.current[agent]
+        table = self.env.heuristic_tables[agent]
+        # On a grid, each neighbour is one step closer to the goal or one
+        # step further than the agent, so only the order on each side is
+        # left to chance
+        distance = table.item(position)
+        closer = []
+        further = []
+        for cell in self.env.grid.get_neighbours(position):
+            (closer if table.item(cell) < distance else further).append(cell)
+        if len(closer) > 1:
+            self.random.shuffle(closer)
+        if len(further) > 1:
+            self.random.shuffle(further)
+        candidates = closer + [position] + further
+        occupied_now = self.occupied_now
+        occupied_next = self.occupied_next
+        next_cells = self.next
+        swap_agent = None
+        if candidates[0] in occupied_now:
+            swap_agent = self.get_swap_agent(agent, candidates[0])
+        if swap_agent is not None:
+            # Back out of the way, the swap agent then takes the cell
+            candidates.reverse()
+
+        for i, cell in enumerate(candidates):
+            if cell in occupied_next:
+                continue
+            other = occupied_now.get(cell)
+            # No swap with an agent moving into this cell
+            if other is not None and next_cells.get(other) == position:
+                continue
+            occupied_next[cell] = agent
+            next_cells[agent] = cell
+            if other is not None and other != agent and other not in next_cells:
+                if not self.pibt(other):
+                    continue
+            if i == 0 and swap_agent is not None and swap_agent not in next_cells \
+                    and position not in occupied_next:
+                occupied_next[position] = swap_agent
+                next_cells[swap_agent] = position
+            return True
+
+        occupied_next[position] = agent
+        next_cells[agent] = position
+        return False
+
+    def get_swap_agent(self, agent, best):
+        """
+        Agent that the agent has to swap with, None if there is none: the
+        agent in the cell it wants, or a neighbour that wants its cell, when
+        they face each other in a corridor that only one of them can leave
+        """
+        position = self.current[agent]
+        if best == position:
+            return None
+        other = self.occupied_now.get(best)
+        if other is not None and other not in self.next and \
+                self.is_swap_required(agent, other, position, best) and self.is_swap_possible(best, position):
+            return other
+        return None
+
+    def get_corridor_step(self, pusher_cell, puller_cell):
+        """
+        Number of ways out of the puller cell, ignoring the pusher cell and
+        dead ends holding an agent at its goal, and the last of them
+        """
+        ways = 0
+        way = None
+        for cell in self.env.grid.get_neighbours(puller_cell):
+            other = self.occupied_now.get(cell)
+            if cell == pusher_cell or (len(self.env.grid.get_neighbours(cell)) == 1 and other is not None
+                                       and self.goals[other] == cell):
+                continue
+            ways += 1
+            way = cell
+        return ways, way
+
+    def is_swap_required(self, pusher, puller, pusher_cell, puller_cell):
+        """
+        Whether the pusher, pushing the puller along the corridor ahead,
+        reaches no place where they can pass each other while getting
+        closer to its goal, and swapping brings both closer to their goals
+        """
+        pusher_table = self.env.heuristic_tables[pusher]
+        puller_table = self.env.heuristic_tables[puller]
+        while pusher_table[puller_cell] < pusher_table[pusher_cell]:
+            ways, way = self.get_corridor_step(pusher_cell, puller_cell)
+            if ways >= 2:
+                return False
+            if ways == 0:
+                break
+            pusher_cell, puller_cell = puller_cell, way
+        return puller_table[pusher_cell] < puller_table[puller_cell] and \
+            (pusher_table[pusher_cell] == 0 or pusher_table[puller_cell] < pusher_table[pusher_cell])
+
+    def is_swap_possible(self, pusher_cell, puller_cell):
+        """
+        Whether the corridor ahead leads to a place where two agents can pass
+        each other
+        """
+        origin = pusher_cell
+        while puller_cell != origin:
+            ways, way = self.get_corridor_step(pusher_cell, puller_cell)
+            if ways >= 2:
+                return True
+            if ways == 0:
+                return False
+            pusher_cell, puller_cell = puller_cell, way
+        return False
+
+    def generate_plan(self, node):
+        paths = {agent: [] for agent in self.agents}
+        while node is not None:
+            for agent, cell in node.configuration.items():
+                paths[agent].append(cell)
+            node = node.parent
+        plan = {}
+        for agent, path in paths.items():
+            path.reverse()
+            # The agent stays at its goal once its path ends
+            while len(path) > 1 and path[-2] == path[-1]:
+                path.pop()
+            plan[agent] = [{'t':t, 'x':x, 'y':y} for t, (x, y) in enumerate(path)]
+        return plan
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("param", help="input file containing map and obstacles")
+    parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--time-limit", type=float, default=None,
+                        help="wall-clock budget of the search, in seconds")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the random tie-breaking")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
+    args = parser.parse_args()
+
+    # Read from input file
+    with open(args.param, 'r') as param_file:
+        try:
+            param = yaml.load(param_file, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    dimension = param["map"]["dimensions"]
+    obstacles = param["map"]["obstacles"]
+    agents = param['agents']
+
+    env = Environment(dimension, agents, obstacles, args.heuristic_cache)
+
+    # Searching
+    pibt = PIBT(env, args.seed)
+    solution = pibt.search(args.time_limit)
+    if not solution:
+        print(" Solution not found" )
+        return
+
+    # Write to output file
+    with open(args.output, 'r') as output_yaml:
+        try:
+            output = yaml.load(output_yaml, Loader=yaml.FullLoader)
+        except yaml.YAMLError as exc:
+            print(exc)
+
+    output["schedule"] = solution
+    output["cost"] = sum(len(path) for path in solution.values())
+    with open(args.output, 'w') as output_yaml:
+        yaml.safe_dump(output, output_yaml)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+
+True-distance heuristic tables for grid maps
+
+A backward breadth-first search from a goal cell gives the exact
+obstacle-aware distance of every cell to that goal. Tables are computed once
+per (map, goal), shared by every planner working on the same map, and can be
+cached on disk so repeated runs on a map skip the precomputation.
+
+"""
+import os
+
+import numpy as np
+
+from occupancy_grid import OccupancyGrid
+
+class DistanceTable(object):
+    _registry = {}
+
+    def __init__(self, grid, cache_dir=None):
+        self.grid = grid
+        self.dimension = grid.dimension
+        self.cache_dir = cache_dir
+        self.map_hash = grid.map_hash
+        self.tables = {}
+        self.cell_neighbours = None
+
+    @classmethod
+    def for_map(cls, dimension, obstacles, cache_dir=None):
+        """
+        Table shared by every caller using the same map
+        """
+        return cls.for_grid(OccupancyGrid.for_map(dimension, obstacles), cache_dir)
+
+    @classmethod
+    def for_grid(cls, grid, cache_dir=None):
+        table = cls._registry.get(grid.map_hash)
+        if table is None:
+            table = cls(grid, cache_dir)
+            cls._registry[grid.map_hash] = table
+        elif cache_dir is not None:
+            table.cache_dir = cache_dir
+        return table
+
+    def get_distance(self, position, goal):
+        return self.get_table(goal)[position[0], position[1]]
+
+    def get_table(self, goal):
+        goal = (goal[0], goal[1])
+        table = self.tables.get(goal)
+        if table is None:
+            table = self.load_table(goal)
+            if table is None:
+                table = self.compute_table(goal)
+                self.save_table(goal, table)
+            self.tables[goal] = table
+        return table
+
+    def compute_table(self, goal):
+        """
+        Backward BFS from the goal, unreachable cells are left at infinity.
+        The search runs level by level on flat cell indices and Python lists,
+        which is several times faster than indexing the array cell by cell.
+        """
+        if self.cell_neighbours is None:
+            self.cell_neighbours = self.get_cell_neighbours()
+        cell_neighbours = self.cell_neighbours
+        inf = np.inf
+        height = self.dimension[1]
+        table = [inf] * (self.dimension[0] * height)
+        table[goal[0] * height + goal[1]] = 0
+        frontier = [goal[0] * height + goal[1]]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for cell in frontier:
+                for neighbour in cell_neighbours[cell]:
+                    if table[neighbour] == inf:
+                        table[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return np.array(table, dtype=float).reshape(self.dimension)
+
+    def get_cell_neighbours(self):
+        """
+        Free neighbours of every cell, as flat indices x * height + y
+        """
+        height = self.dimension[1]
+        cell_neighbours = [()] * (self.dimension[0] * height)
+        for (x, y), neighbours in self.grid.neighbours.items():
+            cell_neighbours[x * height + y] = tuple(nx * height + ny for nx, ny in neighbours)
+        return cell_neighbours
+
+    def get_cache_file(self, goal):
+        return os.path.join(self.cache_dir, self.map_hash, '{}_{}.npy'.format(goal[0], goal[1]))
+
+    def load_table(self, goal):
+        if self.cache_dir is None:
+            return None
+        cache_file = self.get_cache_file(goal)
+        if not os.path.isfile(cache_file):
+            return None
+        return np.load(cache_file)
+
+    def save_table(self, goal, table):
+        if self.cache_dir is None:
+            return
+        cache_file = self.get_cache_file(goal)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        np.save(cache_file, table)
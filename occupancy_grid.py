@@ -0,0 +1,90 @@
+"""
+
+Occupancy grid shared by the grid planners
+
+The obstacles of a map are rasterised once into a boolean array, and the
+free 4-connected neighbours of every free cell are precomputed, so validity
+checks and successor generation are constant-time lookups.
+
+"""
+import hashlib
+
+import numpy as np
+
+class OccupancyGrid(object):
+    _registry = {}
+
+    def __init__(self, dimension, obstacles):
+        self.dimension = (dimension[0], dimension[1])
+        self.map_hash = self.compute_map_hash(dimension, obstacles)
+
+        self.blocked = np.zeros(self.dimension, dtype=bool)
+        for obstacle in obstacles:
+            self.blocked[obstacle[0], obstacle[1]] = True
+
+        self.neighbours = {}
+        self.init_neighbours()
+        self.corridors = {}
+
+    @classmethod
+    def for_map(cls, dimension, obstacles):
+        """
+        Grid shared by every caller using the same map
+        """
+        map_hash = cls.compute_map_hash(dimension, obstacles)
+        grid = cls._registry.get(map_hash)
+        if grid is None:
+            grid = cls(dimension, obstacles)
+            cls._registry[map_hash] = grid
+        return grid
+
+    @staticmethod
+    def compute_map_hash(dimension, obstacles):
+        description = str((dimension[0], dimension[1])) + str(sorted(set(tuple(obstacle) for obstacle in obstacles)))
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def init_neighbours(self):
+        """
+        Free neighbours of each free cell, ordered up, down, left, right
+        """
+        for x in range(self.dimension[0]):
+            for y in range(self.dimension[1]):
+                if self.blocked[x, y]:
+                    continue
+                candidates = ((x, y+1), (x, y-1), (x-1, y), (x+1, y))
+                self.neighbours[(x, y)] = tuple(cell for cell in candidates if self.is_free(cell))
+
+    def is_free(self, position):
+        return 0 <= position[0] < self.dimension[0] and 0 <= position[1] < self.dimension[1] \
+            and not self.blocked[position[0], position[1]]
+
+    def get_neighbours(self, position):
+        return self.neighbours.get((position[0], position[1]), ())
+
+    def get_corridor(self, position):
+        """
+        Maximal chain of cells with exactly two free neighbours through the
+        position, ordered from one end to the other, None if the position is
+        not part of one
+        """
+        position = (position[0], position[1])
+        if position in self.corridors:
+            return self.corridors[position]
+        if len(self.get_neighbours(position)) != 2:
+            self.corridors[position] = None
+            return None
+
+        visited = {position}
+        sides = []
+        for neighbour in self.get_neighbours(position):
+            side = []
+            previous, cell = position, neighbour
+            while cell not in visited and len(self.get_neighbours(cell)) == 2:
+                visited.add(cell)
+                side.append(cell)
+                previous, cell = cell, next(c for c in self.get_neighbours(cell) if c != previous)
+            sides.append(side)
+        corridor = tuple(sides[0][::-1]) + (position,) + tuple(sides[1])
+        for cell in corridor:
+            self.corridors[cell] = corridor
+        return corridor
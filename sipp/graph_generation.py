@@ -8,9 +8,13 @@ See the article: 10.1109/ICRA.2011.5980306
 
 """
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 import argparse
 import yaml
 from bisect import bisect
+from occupancy_grid import OccupancyGrid
 
 class State(object):
     def __init__(self, position=(-1,-1), t=0, interval=(0,float('inf'))):
@@ -60,6 +64,7 @@ class SippGraph(object):
         self.dimensions = map["map"]["dimensions"]
 
         self.obstacles = [tuple(v) for v in map["map"]["obstacles"]]        
+        self.grid = OccupancyGrid.for_map(self.dimensions, self.obstacles)
         self.dyn_obstacles = map["dynamic_obstacles"]
 
         self.sipp_graph = {}
@@ -87,27 +92,11 @@ class SippGraph(object):
                 # print(str(position) + str(self.sipp_graph[position].interval_list))     
 
     def is_valid_position(self, position):
-        dim_check = position[0] in range(self.dimensions[0]) and  position[1] in range(self.dimensions[1])
-        obs_check = position not in self.obstacles
-        # print(dim_check)
-        return dim_check and obs_check
+        return self.grid.is_free(position)
 
     def get_valid_neighbours(self, position):
-        neighbour_list = []
-
-        up = (position[0], position[1]+1)
-        if self.is_valid_position(up): neighbour_list.append(up)
-
-        down = (position[0], position[1]-1)
-        if self.is_valid_position(down): neighbour_list.append(down)
-
-        left = (position[0]-1, position[1])
-        if self.is_valid_position(left): neighbour_list.append(left)
-
-        right = (position[0]+1, position[1])
-        if self.is_valid_position(right): neighbour_list.append(right)
-
-        return neighbour_list
+        # Precomputed up, down, left and right neighbours that are free
+        return list(self.grid.get_neighbours(position))
 
 
 def main():
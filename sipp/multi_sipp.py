@@ -18,6 +18,8 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("map", help="input file containing map and dynamic obstacles")
     parser.add_argument("output", help="output file with the schedule")
+    parser.add_argument("--heuristic-cache", default=None,
+                        help="directory caching the distance tables of each map")
     
     args = parser.parse_args()
     
@@ -36,7 +38,7 @@ def main():
             print(exc)
 
     for i in range(len(map["agents"])):
-        sipp_planner = SippPlanner(map,i)
+        sipp_planner = SippPlanner(map, i, args.heuristic_cache)
     
         if sipp_planner.compute_plan():
             plan = sipp_planner.get_plan()
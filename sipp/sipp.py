@@ -8,19 +8,25 @@ See the article: DOI: 10.1109/ICRA.2011.5980306
 
 """
 
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 import argparse
 import yaml
-from math import fabs
 from graph_generation import SippGraph, State
+from distance_table import DistanceTable
 
 class SippPlanner(SippGraph):
-    def __init__(self, map, agent_id):
+    def __init__(self, map, agent_id, heuristic_cache=None):
         SippGraph.__init__(self, map)
         self.start = tuple(map["agents"][agent_id]["start"])
         self.goal = tuple(map["agents"][agent_id]["goal"])
         self.name = map["agents"][agent_id]["name"]
         self.open = []
 
+        distance_table = DistanceTable.for_grid(self.grid, heuristic_cache)
+        self.heuristic_table = distance_table.get_table(self.goal)
+
     def get_successors(self, state):
         successors = []
         m_time = 1
@@ -38,7 +44,7 @@ class SippPlanner(SippGraph):
         return successors
 
     def get_heuristic(self, position):
-        return fabs(position[0] - self.goal[0]) + fabs(position[1]-self.goal[1])
+        return self.heuristic_table[position]
 
     def compute_plan(self):
         self.open = []
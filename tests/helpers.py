@@ -0,0 +1,136 @@
+"""
+
+Helpers of the tests: benchmark instances, validation of plans and a
+brute-force reference for the optimal sum of costs
+
+"""
+import os
+from collections import deque
+from heapq import heappush, heappop
+from itertools import product
+
+import yaml
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark')
+
+def load_instance(name, num_agents=None):
+    """
+    Dimension, obstacles and agents of a benchmark instance, only the first
+    num_agents agents if given
+    """
+    with open(os.path.join(BENCHMARK_DIR, name), 'r') as param_file:
+        param = yaml.load(param_file, Loader=yaml.FullLoader)
+    agents = param['agents'] if num_agents is None else param['agents'][:num_agents]
+    return param['map']['dimensions'], param['map']['obstacles'], agents
+
+def get_neighbours(dimension, obstacles, cell):
+    blocked = set(tuple(obstacle) for obstacle in obstacles)
+    x, y = cell
+    for neighbour in ((x, y+1), (x, y-1), (x-1, y), (x+1, y)):
+        if 0 <= neighbour[0] < dimension[0] and 0 <= neighbour[1] < dimension[1] and neighbour not in blocked:
+            yield neighbour
+
+def check_plan(plan, dimension, obstacles, agents):
+    """
+    Assert that a plan in the format of CBS.generate_plan takes every agent
+    from its start to its goal by valid moves, without vertex or edge
+    conflicts, the agents staying at their goal once their path ends.
+    Returns the sum of costs.
+    """
+    assert sorted(plan) == sorted(agent['name'] for agent in agents)
+    paths = {}
+    for agent in agents:
+        path = [(step['x'], step['y']) for step in plan[agent['name']]]
+        assert [step['t'] for step in plan[agent['name']]] == list(range(len(path)))
+        assert path[0] == tuple(agent['start'])
+        assert path[-1] == tuple(agent['goal'])
+        paths[agent['name']] = path
+    check_paths(paths, dimension, obstacles)
+    return sum(len(path) for path in paths.values())
+
+def check_paths(paths, dimension, obstacles):
+    """
+    Assert that paths, as lists of cells, move between free neighbouring
+    cells without vertex or edge conflicts
+    """
+    blocked = set(tuple(obstacle) for obstacle in obstacles)
+    for path in paths.values():
+        assert not blocked & set(path)
+        for cell, next_cell in zip(path, path[1:]):
+            assert next_cell == cell or next_cell in get_neighbours(dimension, obstacles, cell)
+
+    def get_cell(name, t):
+        return paths[name][min(t, len(paths[name]) - 1)]
+
+    for t in range(max(len(path) for path in paths.values())):
+        cells = {}
+        for name in paths:
+            cell = get_cell(name, t)
+            assert cell not in cells, "vertex conflict of {} and {} at {}".format(name, cells.get(cell), t)
+            cells[cell] = name
+        for name in paths:
+            other = cells.get(get_cell(name, t + 1))
+            if other is not None and other != name:
+                assert get_cell(other, t + 1) != get_cell(name, t), \
+                    "edge conflict of {} and {} at {}".format(name, other, t)
+
+def get_distances(dimension, obstacles, goal):
+    distances = {goal: 0}
+    queue = deque([goal])
+    while queue:
+        cell = queue.popleft()
+        for neighbour in get_neighbours(dimension, obstacles, cell):
+            if neighbour not in distances:
+                distances[neighbour] = distances[cell] + 1
+                queue.append(neighbour)
+    return distances
+
+def optimal_cost(dimension, obstacles, agents):
+    """
+    Optimal sum of costs, counting the states of each path, by A* over the
+    joint states of all the agents. An agent may finish at its goal at any
+    step, and then stays there for good. Only for a few agents.
+    """
+    starts = tuple(tuple(agent['start']) for agent in agents)
+    goals = tuple(tuple(agent['goal']) for agent in agents)
+    distances = [get_distances(dimension, obstacles, goal) for goal in goals]
+    moves = {}
+
+    def get_moves(cell):
+        if cell not in moves:
+            moves[cell] = [cell] + list(get_neighbours(dimension, obstacles, cell))
+        return moves[cell]
+
+    def heuristic(cells, finished):
+        return sum(0 if done else table[cell] for cell, done, table in zip(cells, finished, distances))
+
+    initial = (starts, tuple(False for _ in agents))
+    g_score = {initial: 0}
+    open_heap = [(heuristic(*initial), 0, initial)]
+    while open_heap:
+        _, g, node = heappop(open_heap)
+        if g > g_score[node]:
+            continue
+        cells, finished = node
+        if all(finished):
+            return g + len(agents)
+        successors = []
+        # Finishing at the goal is free
+        for i, (cell, goal) in enumerate(zip(cells, goals)):
+            if not finished[i] and cell == goal:
+                successors.append((g, (cells, finished[:i] + (True,) + finished[i+1:])))
+        # Agents not finished yet all move, each at a cost of 1
+        step_cost = sum(1 for done in finished if not done)
+        options = [[cell] if done else get_moves(cell) for cell, done in zip(cells, finished)]
+        for next_cells in product(*options):
+            if len(set(next_cells)) < len(next_cells):
+                continue
+            if any(next_cells[i] == cells[j] and next_cells[j] == cells[i]
+                   for i in range(len(cells)) for j in range(i + 1, len(cells))):
+                continue
+            successors.append((g + step_cost, (next_cells, finished)))
+        for next_g, next_node in successors:
+            if next_g < g_score.get(next_node, float('inf')):
+                g_score[next_node] = next_g
+                heappush(open_heap, (next_g + heuristic(*next_node), next_g, next_node))
+    return None
@@ -0,0 +1,32 @@
+from cbs.cbs import Location, VertexConstraint, Constraints, Environment
+
+
+def make_corridor():
+    return Environment([5, 1], [{'name': 'agent0', 'start': [0, 0], 'goal': [2, 0]}], [])
+
+def test_landmark_at_goal_does_not_delay_goal():
+    env = make_corridor()
+    constraints = Constraints()
+    constraints.add_positive_vertex_constraint(VertexConstraint(6, Location(2, 0)))
+    path = env.compute_agent_solution('agent0', constraints)
+    assert [state.location.x for state in path] == [0, 1, 2]
+    assert env.path_satisfies(path, constraints)
+
+def test_landmark_elsewhere_delays_goal():
+    env = make_corridor()
+    constraints = Constraints()
+    constraints.add_positive_vertex_constraint(VertexConstraint(4, Location(3, 0)))
+    path = env.compute_agent_solution('agent0', constraints)
+    assert len(path) == 6
+    assert path[4].location == Location(3, 0)
+    assert env.path_satisfies(path, constraints)
+
+def test_joint_search_landmark_at_goal():
+    env = Environment([5, 2], [{'name': 'agent0', 'start': [0, 0], 'goal': [2, 0]},
+                               {'name': 'agent1', 'start': [4, 1], 'goal': [3, 1]}], [])
+    constraints = Constraints()
+    constraints.add_positive_vertex_constraint(VertexConstraint(6, Location(2, 0)))
+    paths = env.compute_meta_agent_solution(['agent0', 'agent1'],
+                                            {'agent0': constraints, 'agent1': Constraints()})
+    assert len(paths['agent0']) == 3
+    assert len(paths['agent1']) == 2
@@ -0,0 +1,42 @@
+import pytest
+
+from cbs.lifelong import SOLVERS, LifelongPlanner
+from helpers import load_instance, check_paths
+
+def get_paths(schedule):
+    return {name: [(step['x'], step['y']) for step in path] for name, path in schedule.items()}
+
+@pytest.mark.parametrize('solver', sorted(SOLVERS))
+def test_schedule(solver):
+    dimension, obstacles, agents = load_instance('8x8_obst12/map_8by8_obst12_agents4_ex9.yaml')
+    planner = LifelongPlanner(dimension, obstacles, agents, window=5, replan_period=5, solver=solver,
+                              time_limit=5, seed=3)
+    schedule = planner.run(40)
+    assert all(len(path) == 41 for path in schedule.values())
+    check_paths(get_paths(schedule), dimension, obstacles)
+    assert planner.completed_goals > 0
+
+def test_random_goals_reachable():
+    # A wall leaves the first column on its own
+    obstacles = [[1, y] for y in range(4)]
+    agents = [{'name': 'agent0', 'start': [0, 0], 'goal': [0, 1]},
+              {'name': 'agent1', 'start': [3, 3], 'goal': [2, 0]}]
+    planner = LifelongPlanner([4, 4], obstacles, agents, window=5, replan_period=5, seed=0)
+    schedule = planner.run(40)
+    check_paths(get_paths(schedule), [4, 4], obstacles)
+    assert all(step['x'] == 0 for step in schedule['agent0'])
+    assert planner.failed_replans == 0
+
+def test_failed_replan_keeps_other_agents_moving():
+    # agent0 is walled in with a goal it cannot reach
+    obstacles = [[3, y] for y in range(6)]
+    agents = [{'name': 'agent0', 'start': [0, 0], 'goals': [[5, 0]]},
+              {'name': 'agent1', 'start': [5, 5], 'goal': [4, 0]},
+              {'name': 'agent2', 'start': [4, 5], 'goal': [5, 0]}]
+    planner = LifelongPlanner([6, 6], obstacles, agents, window=5, replan_period=5, seed=0)
+    paths = get_paths(planner.run(40))
+    check_paths(paths, [6, 6], obstacles)
+    assert planner.failed_replans > 0
+    assert set(paths['agent0']) == {(0, 0)}
+    assert len(set(paths['agent1'])) > 1 and len(set(paths['agent2'])) > 1
+    assert planner.completed_goals > 0
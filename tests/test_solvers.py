@@ -0,0 +1,111 @@
+import pytest
+
+from cbs.cbs import Constraints, Environment, CBS
+from cbs.anytime import AnytimeCBS
+from cbs.ecbs import ECBS
+from cbs.independence import IndependenceDetection
+from cbs.lns import MAPFLNS
+from cbs.parallel import ParallelCBS
+from cbs.pbs import PBS
+from cbs.pibt import PIBT
+from helpers import load_instance, check_plan, optimal_cost
+
+def make_agents(*cells):
+    return [{'name': 'agent{}'.format(i), 'start': list(start), 'goal': list(goal)}
+            for i, (start, goal) in enumerate(cells)]
+
+# Small instances whose optimal sum of costs is found by brute force: agents
+# swapping through pockets, an agent whose goal lies on the path of another,
+# agents crossing in open space, and the first agents of benchmark instances
+# that delay each other
+SMALL_INSTANCES = {
+    'swap': ([3, 3], [[0, 1], [2, 1]], make_agents(((0, 0), (2, 2)), ((2, 2), (0, 0)))),
+    'target': ([5, 2], [[0, 1], [2, 1], [3, 1], [4, 1]], make_agents(((0, 0), (4, 0)), ((3, 0), (1, 0)))),
+    'crossing': ([4, 4], [], make_agents(((0, 1), (3, 1)), ((1, 0), (1, 3)), ((0, 2), (3, 2)), ((2, 0), (2, 3)))),
+    'agents8_ex38': load_instance('8x8_obst12/map_8by8_obst12_agents8_ex38.yaml', 3),
+    'agents10_ex9': load_instance('8x8_obst12/map_8by8_obst12_agents10_ex9.yaml', 4),
+    'agents10_ex35': load_instance('8x8_obst12/map_8by8_obst12_agents10_ex35.yaml', 3),
+    'agents12_ex34': load_instance('8x8_obst12/map_8by8_obst12_agents12_ex34.yaml', 4),
+    'agents14_ex24': load_instance('8x8_obst12/map_8by8_obst12_agents14_ex24.yaml', 3),
+    'agents14_ex29': load_instance('8x8_obst12/map_8by8_obst12_agents14_ex29.yaml', 3),
+}
+
+# Full benchmark instances, with the optimal sum of costs on which the
+# optimal solvers agree with a brute-force joint search
+BENCHMARK_INSTANCES = {
+    '8x8_obst12/map_8by8_obst12_agents8_ex0.yaml': 78,
+    '8x8_obst12/map_8by8_obst12_agents12_ex1.yaml': 83,
+    '8x8_obst12/map_8by8_obst12_agents12_ex23.yaml': 98,
+}
+
+OPTIMAL_SOLVERS = {
+    'cbs': lambda env: CBS(env).search(),
+    'cbs-dg': lambda env: CBS(env, heuristic='dg').search(),
+    'cbs-wdg': lambda env: CBS(env, heuristic='wdg').search(),
+    'cbs-disjoint': lambda env: CBS(env, disjoint_splitting=True).search(),
+    'cbs-wdg-disjoint': lambda env: CBS(env, heuristic='wdg', disjoint_splitting=True).search(),
+    'cbs-no-reasoning': lambda env: CBS(env, symmetry_reasoning=False, target_reasoning=False).search(),
+    'cbs-bypass': lambda env: CBS(env, bypass=True).search(),
+    'cbs-no-cat': lambda env: CBS(env, conflict_avoidance=False).search(),
+    'ma-cbs': lambda env: CBS(env, merge_threshold=1).search(),
+    'anytime': lambda env: AnytimeCBS(env).search(),
+    'independence': lambda env: IndependenceDetection(env).search(),
+    'parallel': lambda env: ParallelCBS(env, 2).search(),
+}
+
+@pytest.fixture(scope='module')
+def small_optimal_costs():
+    return {name: optimal_cost(*instance) for name, instance in SMALL_INSTANCES.items()}
+
+@pytest.mark.parametrize('instance', sorted(SMALL_INSTANCES))
+@pytest.mark.parametrize('solver', sorted(OPTIMAL_SOLVERS))
+def test_optimal_small(solver, instance, small_optimal_costs):
+    dimension, obstacles, agents = SMALL_INSTANCES[instance]
+    plan = OPTIMAL_SOLVERS[solver](Environment(dimension, agents, obstacles))
+    assert check_plan(plan, dimension, obstacles, agents) == small_optimal_costs[instance]
+
+@pytest.mark.parametrize('instance', sorted(BENCHMARK_INSTANCES))
+@pytest.mark.parametrize('solver', sorted(OPTIMAL_SOLVERS))
+def test_optimal_benchmark(solver, instance):
+    dimension, obstacles, agents = load_instance(instance)
+    plan = OPTIMAL_SOLVERS[solver](Environment(dimension, agents, obstacles))
+    assert check_plan(plan, dimension, obstacles, agents) == BENCHMARK_INSTANCES[instance]
+
+@pytest.mark.parametrize('instance', sorted(BENCHMARK_INSTANCES))
+@pytest.mark.parametrize('suboptimality', [1.2, 1.5])
+def test_ecbs_bound(suboptimality, instance):
+    dimension, obstacles, agents = load_instance(instance)
+    ecbs = ECBS(Environment(dimension, agents, obstacles), suboptimality)
+    plan = ecbs.search()
+    cost = check_plan(plan, dimension, obstacles, agents)
+    optimal = BENCHMARK_INSTANCES[instance]
+    assert optimal <= cost <= suboptimality * optimal
+    assert ecbs.lower_bound <= optimal
+
+@pytest.mark.parametrize('instance', sorted(SMALL_INSTANCES))
+def test_joint_search(instance):
+    # Meta-agents are pairs by default
+    dimension, obstacles, agents = SMALL_INSTANCES[instance]
+    agents = agents[:2]
+    env = Environment(dimension, agents, obstacles)
+    names = [agent['name'] for agent in agents]
+    paths = env.compute_meta_agent_solution(names, {name: Constraints() for name in names})
+    plan = CBS(env).generate_plan(paths)
+    assert check_plan(plan, dimension, obstacles, agents) == optimal_cost(dimension, obstacles, agents)
+
+@pytest.mark.parametrize('instance', sorted(BENCHMARK_INSTANCES))
+def test_suboptimal_solvers(instance):
+    dimension, obstacles, agents = load_instance(instance)
+    optimal = BENCHMARK_INSTANCES[instance]
+    env = Environment(dimension, agents, obstacles)
+
+    pbs_plan = PBS(env).search()
+    pbs_cost = check_plan(pbs_plan, dimension, obstacles, agents)
+    assert pbs_cost >= optimal
+
+    assert check_plan(PIBT(env, seed=0).search(), dimension, obstacles, agents) >= optimal
+
+    lns = MAPFLNS(env, seed=0)
+    lns_cost = check_plan(lns.search(pbs_plan, iteration_limit=20), dimension, obstacles, agents)
+    assert optimal <= lns_cost <= pbs_cost
+    assert lns.cost_history[-1][1] == lns_cost